@@ -1,58 +1,382 @@
 import tkinter as tk
-from tkinter import filedialog, messagebox
-import mmap
+from tkinter import filedialog, messagebox, simpledialog, ttk
+import tkinter.font as tkfont
+import os
+import re
+import time
+from array import array
+from bisect import bisect_left
+
+from export import Export, line_span, matching_line_spans
+from file_search import FileSearch
+from instrumentation import ENABLED as INSTRUMENTED, profiled, stats, timed
+from log_fields import FieldExtractor, FieldTable
+from mapped_file import GROWN, REPLACED, TRUNCATED
+from reader_core import PENDING, Document, parse_range
+from search_engine import hit_histogram
+
+# Lines decoded above and below the visible rows of the viewport
+VIEWPORT_MARGIN = 200
+INDEX_POLL_MS = 100
+SEARCH_POLL_MS = 50
+FOLLOW_POLL_MS = 500
+ENCODINGS = [("Auto-detect", ''), ("UTF-8", 'utf-8'), ("UTF-16 LE", 'utf-16-le'),
+             ("UTF-16 BE", 'utf-16-be'), ("Latin-1", 'latin-1')]
+GUTTER_PADDING = 4
+MINIMAP_WIDTH = 40
+MINIMAP_REDRAW_MS = 500
+STATS_REFRESH_MS = 500
+# Cross-file results added to the tree per poll, so a burst of hits cannot freeze the window
+FILE_RESULTS_PER_POLL = 200
+# Files with a line longer than this show every line as a horizontal slice of SLICE_BYTES
+LONG_LINE_BYTES = 64 * 1024
+SLICE_BYTES = 4096
+SCROLL_UNIT_BYTES = 16
+# Significant digits the navigation slider passes its percentage with; enough to name any line of a huge file
+SLIDER_DIGITS = 12
+# Highlight All tags at most this many matches per pass, so '.' on a screen of long lines stays responsive
+MAX_VISIBLE_HIGHLIGHTS = 2000
 
 
 class LineNumberedText(tk.Frame):
     def __init__(self, master, *args, **kwargs):
         tk.Frame.__init__(self, master, *args, **kwargs)
+        self.first_line = 1
+        self.line_count = 0
         self.text = tk.Text(self, wrap=tk.NONE)
-        self.linenumbers = tk.Text(self, width=4, padx=4, takefocus=0, border=0, 
-                                   background='lightgrey', state='disabled')
+        self.font = tkfont.Font(font=self.text.cget('font'))
+        self.linenumbers = tk.Canvas(self, width=0, takefocus=0, highlightthickness=0,
+                                     background='lightgrey')
         self.linenumbers.pack(side=tk.LEFT, fill=tk.Y)
         self.text.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
 
-        self.linenumbers.tag_configure('line', justify='right')
-        self.text.bind('<KeyPress>', self.on_key_press)
-        self.text.bind('<KeyRelease>', self.on_key_release)
+        self.text.bind('<<Modified>>', self.on_modified)
+        self.text.bind('<Configure>', self.on_configure)
 
         self.update_line_numbers()
 
-    def on_key_press(self, event):
-        self.update_line_numbers()
+    def on_modified(self, event):
+        # Clearing the flag re-arms <<Modified>> for the next edit
+        self.text.edit_modified(False)
+        if self.text_line_count() != self.line_count:
+            self.update_line_numbers()
 
-    def on_key_release(self, event):
+    def on_configure(self, event):
         self.update_line_numbers()
 
+    def text_line_count(self):
+        return int(self.text.index('end-1c').split('.')[0])
+
+    @timed
+    def set_text(self, content):
+        self.text.delete('1.0', tk.END)
+        self.text.insert('1.0', content)
+
+    @timed
     def update_line_numbers(self):
-        self.linenumbers.config(state='normal')
-        self.linenumbers.delete('1.0', tk.END)
-        num_lines = int(self.text.index(tk.END).split('.')[0]) - 1
-        line_numbers_string = '\n'.join(str(i) for i in range(1, num_lines + 1))
-        self.linenumbers.insert('1.0', line_numbers_string)
-        self.linenumbers.config(state='disabled')
-        
+        # Only the rows currently on screen are drawn, so the cost is independent of file length
+        self.linenumbers.delete('all')
+        self.line_count = self.text_line_count()
+        last_line = self.first_line + self.line_count - 1
+
         # Adjust width of line numbers widget
-        width = len(str(num_lines))
-        if self.linenumbers.cget('width') != width:
+        width = self.font.measure('0' * len(str(last_line))) + 2 * GUTTER_PADDING
+        if int(self.linenumbers.cget('width')) != width:
             self.linenumbers.config(width=width)
 
-class FastTextReader(tk.Tk):
-    def __init__(self):
-        super().__init__()
+        index = self.text.index('@0,0')
+        while True:
+            dline = self.text.dlineinfo(index)
+            if dline is None:
+                break
+            line = int(index.split('.')[0])
+            self.linenumbers.create_text(width - GUTTER_PADDING, dline[1], anchor='ne',
+                                         text=str(self.first_line + line - 1), font=self.font)
+            if line >= self.line_count:
+                break
+            index = f"{line + 1}.0"
 
-        self.title("Fast Text Reader")
-        self.geometry("800x600")
 
-        # Create menu
-        self.create_menu()
+class StatsPanel(tk.Toplevel):
+    """Live table of the instrumentation counters (FTR_INSTRUMENT=1)."""
 
-        # Create search frame
-        self.create_search_frame()
+    def __init__(self, master):
+        tk.Toplevel.__init__(self, master)
+        self.title("Performance")
+        self.text = tk.Text(self, wrap=tk.NONE, width=80, height=16, font='TkFixedFont')
+        self.text.pack(expand=True, fill='both')
+        tk.Button(self, text="Reset", command=stats.reset).pack(side=tk.BOTTOM)
+        self.refresh()
+
+    def refresh(self):
+        self.text.delete('1.0', tk.END)
+        self.text.insert('1.0', stats.report())
+        self.after(STATS_REFRESH_MS, self.refresh)
+
+
+class FileSearchPanel(tk.Toplevel):
+    """Results of a search across files, files with the most matches first."""
+
+    def __init__(self, app, search):
+        tk.Toplevel.__init__(self, app)
+        self.app = app
+        self.search = search
+        self.title(f"Search {search.pattern!r} in {search.spec}")
+        self.geometry("700x400")
+
+        self.status_var = tk.StringVar()
+        tk.Label(self, textvariable=self.status_var, anchor='w', relief=tk.SUNKEN).pack(side=tk.BOTTOM, fill=tk.X)
+        self.tree = ttk.Treeview(self, columns=('matches',))
+        self.tree.heading('#0', text="File / line")
+        self.tree.heading('matches', text="Matches")
+        self.tree.column('matches', width=80, stretch=False, anchor='e')
+        scrollbar = tk.Scrollbar(self, orient='vertical', command=self.tree.yview)
+        self.tree.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side=tk.RIGHT, fill='y')
+        self.tree.pack(expand=True, fill='both')
+
+        # Sort keys of the file rows in display order, and what each hit row opens
+        self.keys = []
+        self.targets = {}
+        self.files = 0
+        self.matches = 0
+        self.errors = 0
+
+        self.tree.bind('<Double-1>', self.open_selected)
+        self.tree.bind('<Return>', self.open_selected)
+        self.protocol('WM_DELETE_WINDOW', self.close)
+        search.start()
+        self.poll()
+
+    def poll(self):
+        for _ in range(FILE_RESULTS_PER_POLL):
+            if self.search.results.empty():
+                break
+            self.add_result(*self.search.results.get())
+
+        status = f"{self.matches:,} matches in {self.files:,} files"
+        if self.errors:
+            status += f", {self.errors:,} unreadable"
+        if self.search.total is None:
+            status += " (listing files)"
+        elif not self.search.done:
+            status += f" (searched {self.search.searched:,} of {self.search.total:,} files)"
+        self.status_var.set(status)
+        if not self.search.done or not self.search.results.empty():
+            self.after(SEARCH_POLL_MS, self.poll)
+
+    def add_result(self, path, count, hits, error):
+        if error is not None:
+            self.errors += 1
+            return
+        self.files += 1
+        self.matches += count
+        key = (-count, path)
+        position = bisect_left(self.keys, key)
+        self.keys.insert(position, key)
+        node = self.tree.insert('', position, text=path, values=(f"{count:,}",))
+        self.targets[node] = (path, None, None)
+        for line, start, end, snippet in hits:
+            item = self.tree.insert(node, 'end', text=f"{line + 1}: {snippet}")
+            self.targets[item] = (path, start, end)
+        if count > len(hits):
+            self.tree.insert(node, 'end', text=f"... {count - len(hits):,} more in this file")
+
+    def open_selected(self, event):
+        for item in self.tree.selection():
+            if item in self.targets:
+                self.app.open_hit(*self.targets[item])
+                return
+
+    def close(self):
+        self.search.cancel()
+        self.destroy()
+
+
+class FilterPanel(tk.Toplevel):
+    """Lines of one tab whose log fields match a query such as level=ERROR AND component=db.
+
+    Only the rows on screen are decoded, so the list scrolls the same
+    however many lines match.
+    """
+
+    def __init__(self, app, view):
+        tk.Toplevel.__init__(self, app)
+        self.app = app
+        self.view = view
+        self.doc = view.doc
+        self.title(f"Filter {os.path.basename(self.doc.path)}")
+        self.geometry("800x400")
+
+        query_frame = tk.Frame(self)
+        query_frame.pack(side=tk.TOP, fill=tk.X)
+        self.query_var = tk.StringVar()
+        query_entry = tk.Entry(query_frame, textvariable=self.query_var)
+        query_entry.pack(side=tk.LEFT, expand=True, fill=tk.X)
+        query_entry.bind('<Return>', self.apply)
+        tk.Button(query_frame, text="Apply", command=self.apply).pack(side=tk.LEFT)
+
+        self.status_var = tk.StringVar(value="Fields: " + ', '.join(FieldTable().fields))
+        tk.Label(self, textvariable=self.status_var, anchor='w', relief=tk.SUNKEN).pack(side=tk.BOTTOM, fill=tk.X)
+        self.scrollbar = tk.Scrollbar(self, orient='vertical', command=self.on_scrollbar)
+        self.scrollbar.pack(side=tk.RIGHT, fill='y')
+        self.text = tk.Text(self, wrap=tk.NONE, state=tk.DISABLED)
+        self.text.pack(expand=True, fill='both')
+        self.linespace = tkfont.Font(font=self.text.cget('font')).metrics('linespace')
+
+        # File line numbers of the matching lines, and the index of the one shown at the top
+        self.lines = array('Q')
+        self.top = 0
+        self.query = ''
+        self.poll_job = None
+
+        self.text.bind('<Configure>', self.render)
+        self.text.bind('<MouseWheel>', self.on_wheel)
+        self.text.bind('<Button-4>', self.on_wheel)
+        self.text.bind('<Button-5>', self.on_wheel)
+        self.text.bind('<Double-1>', self.open_line)
+        self.protocol('WM_DELETE_WINDOW', self.close)
+        query_entry.focus_set()
+
+    def apply(self, event=None):
+        if self.view.doc is None:
+            return
+        # The tab may have been reopened since; filter what it shows now
+        self.doc = self.view.doc
+        self.query = self.query_var.get()
+        self.view.extract_fields()
+        self.poll()
+
+    def poll(self):
+        self.poll_job = None
+        if self.view.doc is not self.doc:
+            return
+        fields = self.view.fields
+        if self.view.field_extractor is not None and self.view.field_extractor.is_alive():
+            self.status_var.set(f"Parsing fields {fields.parsed / max(1, self.doc.line_count):.0%}")
+            self.poll_job = self.after(SEARCH_POLL_MS, self.poll)
+            return
+        try:
+            self.lines = fields.filter(self.query)
+        except ValueError as e:
+            messagebox.showerror("Filter Error", str(e), parent=self)
+            return
+        status = f"{len(self.lines):,} of {fields.parsed:,} lines"
+        if not self.doc.index.complete:
+            status += " (indexed so far)"
+        self.status_var.set(status)
+        self.top = 0
+        self.render()
+
+    def visible_rows(self):
+        return max(1, self.text.winfo_height() // self.linespace)
+
+    def render(self, event=None):
+        rows = self.visible_rows()
+        count = len(self.lines)
+        self.top = max(0, min(self.top, count - rows))
+        shown = []
+        if self.view.doc is self.doc:
+            width = len(str(self.lines[-1] + 1)) if count else 1
+            sliced = self.doc.index.longest > LONG_LINE_BYTES
+            for line in self.lines[self.top:self.top + rows]:
+                if sliced:
+                    content = self.doc.get_line_slices(line, line + 1, 0, SLICE_BYTES)
+                else:
+                    content = self.doc.get_lines(line, line + 1)
+                shown.append(f"{line + 1:>{width}}  {content}")
+        self.text.configure(state=tk.NORMAL)
+        self.text.delete('1.0', tk.END)
+        self.text.insert('1.0', '\n'.join(shown))
+        self.text.configure(state=tk.DISABLED)
+        self.scrollbar.set(self.top / max(1, count), min(1.0, (self.top + rows) / max(1, count)))
+
+    def on_scrollbar(self, *args):
+        if args[0] == 'moveto':
+            self.top = int(float(args[1]) * len(self.lines))
+        else:
+            self.top += int(args[1]) * (self.visible_rows() if args[2] == 'pages' else 1)
+        self.render()
+
+    def on_wheel(self, event):
+        self.top += -3 if event.num == 4 or event.delta > 0 else 3
+        self.render()
+        return 'break'
+
+    def open_line(self, event):
+        row = int(self.text.index(f"@{event.x},{event.y}").split('.')[0]) - 1
+        if self.view.doc is not self.doc or self.top + row >= len(self.lines):
+            return
+        top = max(0, self.lines[self.top + row] - self.view.visible_rows() // 2)
+        if self.view.active:
+            self.view.show_line(top)
+        else:
+            self.view.saved_top = top
+            self.app.notebook.select(self.view)
+
+    def close(self):
+        if self.poll_job is not None:
+            self.after_cancel(self.poll_job)
+        self.destroy()
+
+
+class HitMinimap(tk.Canvas):
+    """Histogram of search hits over the whole file, one bucket per pixel row."""
+
+    def __init__(self, master, on_select, *args, **kwargs):
+        tk.Canvas.__init__(self, master, *args, width=MINIMAP_WIDTH, highlightthickness=0,
+                           background='white', **kwargs)
+        self.on_select = on_select
+        self.matches = None
+        self.size = 0
+
+        self.bind('<Configure>', self.on_configure)
+        self.bind('<Button-1>', self.on_click)
+
+    def show(self, matches, size):
+        self.matches = matches
+        self.size = size
+        self.redraw()
+
+    def on_configure(self, event):
+        self.redraw()
+
+    def redraw(self):
+        self.delete('all')
+        if self.matches is None or self.size == 0:
+            return
+        counts = hit_histogram(self.matches.starts, self.size, self.winfo_height())
+        peak = max(counts, default=0)
+        if peak == 0:
+            return
+        width = self.winfo_width()
+        for row, count in enumerate(counts):
+            if count:
+                self.create_line(0, row, max(2, round(width * count / peak)), row, fill='orange')
+
+    def on_click(self, event):
+        if self.matches is None or self.size == 0:
+            return
+        height = max(1, self.winfo_height())
+        row = min(max(event.y, 0), height - 1)
+        self.on_select(row * self.size // height, (row + 1) * self.size // height)
+
+
+class DocumentView(tk.Frame):
+    """One open file in a tab: the viewport, search and follow state of its Document.
 
-        # Create main content frame
-        self.content_frame = tk.Frame(self)
-        self.content_frame.pack(expand=True, fill='both')
+    Only the selected tab keeps decoded text in its widget. The others keep
+    their index and scroll position and refill from the shared page cache
+    when selected again.
+    """
+
+    def __init__(self, master, app):
+        tk.Frame.__init__(self, master)
+        self.app = app
+
+        # Create horizontal scrollbar first so it keeps its row when the tab shrinks
+        self.h_scrollbar = tk.Scrollbar(self, orient='horizontal', command=self.on_h_scrollbar)
+        self.h_scrollbar.pack(side=tk.BOTTOM, fill='x')
 
         # Create navigation slider
         self.create_navigation_slider()
@@ -63,9 +387,670 @@ class FastTextReader(tk.Tk):
         # Create scrollbars
         self.create_scrollbars()
 
+        # Viewport variables
+        self.doc = None
+        self.active = False
+        self.saved_top = 0
+        self.status = ''
+        self.column_status = ''
+        # Fraction of the file indexed while that is still going on, else None
+        self.loading = None
+        self.follow_job = None
+        # Pending sync of gutter, window and bars to the text's scroll position
+        self.scroll_job = None
+        # Last value put on the slider, to tell its echo from a drag
+        self.slider_value = None
+        self.window_start = 0
+        self.window_end = 0
+        # In sliced mode, the byte offset into each line where the shown slice begins
+        self.sliced = False
+        self.h_offset = 0
+        self.linespace = tkfont.Font(font=self.text_widget.text.cget('font')).metrics('linespace')
+
         # Search variables
-        self.search_start = "1.0"
+        self.search_worker = None
+        self.matches = None
+        self.minimap_drawn_at = 0
+        self.pending_jump = None
+        self.search_offset = None
         self.last_search = None
+        self.search_options = None
+        # File lines [first, last) whose matches carry the Highlight All tag, or None
+        self.highlighted = None
+
+        # Log fields, parsed when a filter first needs them
+        self.fields = None
+        self.field_extractor = None
+        self.export = None
+
+    def create_navigation_slider(self):
+        # Unrounded, so the slider maps to lines continuously however long the file; a label of that
+        # precision would only be noise
+        self.nav_slider = tk.Scale(self, from_=0, to=100, resolution=0, digits=SLIDER_DIGITS, showvalue=False,
+                                   orient=tk.VERTICAL, command=self.on_nav_slider_move)
+        self.nav_slider.pack(side=tk.LEFT, fill=tk.Y)
+
+        self.minimap = HitMinimap(self, self.on_minimap_select)
+        self.minimap.pack(side=tk.LEFT, fill=tk.Y)
+
+    def create_text_widget(self):
+        self.text_widget = LineNumberedText(self)
+        self.text_widget.pack(side=tk.LEFT, expand=True, fill='both')
+        text = self.text_widget.text
+        text.tag_config('match', background='#fff3a0')
+        text.tag_config('search', background='yellow')
+        text.tag_raise('search')
+
+    def create_scrollbars(self):
+        self.v_scrollbar = tk.Scrollbar(self, orient='vertical', command=self.on_v_scrollbar)
+        self.v_scrollbar.pack(side=tk.RIGHT, fill='y')
+        self.text_widget.text.configure(yscrollcommand=self.on_text_scroll)
+        self.text_widget.text.configure(xscrollcommand=self.on_text_xscroll)
+
+    def set_status(self, status):
+        self.status = status
+        if self.active:
+            self.app.status_var.set(status)
+
+    def set_column_status(self, status):
+        self.column_status = status
+        if self.active:
+            self.app.column_var.set(status)
+
+    def set_loading(self, progress):
+        self.loading = progress
+        if self.active:
+            self.app.set_loading(progress)
+
+    def set_document(self, doc):
+        self.cancel_search()
+        self.cancel_fields()
+        self.cancel_export()
+        if self.doc is not None:
+            self.doc.close()
+        self.doc = doc
+        self.h_offset = 0
+        self.saved_top = 0
+        self.slider_value = None
+        if self.active:
+            self.load_window(0)
+            self.update_nav_slider()
+        doc.build_index_in_background()
+        doc.build_trigram_index_in_background()
+        self.poll_index(doc)
+        if self.active and self.app.follow_var.get():
+            self.schedule_follow()
+
+    def activate(self):
+        self.active = True
+        self.app.status_var.set(self.status)
+        self.app.column_var.set(self.column_status)
+        self.app.set_loading(self.loading)
+        self.load_window(self.saved_top)
+        self.update_scroll_position(self.top_line(), self.visible_rows())
+        if self.app.follow_var.get():
+            self.schedule_follow()
+
+    def deactivate(self):
+        # Drop the decoded text; the index, matches and position stay
+        self.saved_top = self.top_line()
+        self.active = False
+        self.pending_jump = None
+        if self.follow_job is not None:
+            self.after_cancel(self.follow_job)
+            self.follow_job = None
+        if self.scroll_job is not None:
+            self.after_cancel(self.scroll_job)
+            self.scroll_job = None
+        self.text_widget.set_text('')
+        self.window_start = 0
+        self.window_end = 0
+        self.highlighted = None
+
+    def close(self):
+        self.active = False
+        self.cancel_search()
+        self.cancel_fields()
+        self.cancel_export()
+        if self.follow_job is not None:
+            self.after_cancel(self.follow_job)
+            self.follow_job = None
+        if self.scroll_job is not None:
+            self.after_cancel(self.scroll_job)
+            self.scroll_job = None
+        if self.doc is not None:
+            self.doc.close()
+            self.doc = None
+
+    def visible_rows(self):
+        return max(1, self.text_widget.text.winfo_height() // self.linespace)
+
+    def top_line(self):
+        # Zero-based file line shown at the top of the viewport
+        index = self.text_widget.text.index('@0,0')
+        return self.window_start + int(index.split('.')[0]) - 1
+
+    @timed
+    def load_window(self, top):
+        count = self.doc.line_count
+        top = max(0, min(top, count - 1))
+        start = max(0, top - VIEWPORT_MARGIN)
+        end = min(count, top + self.visible_rows() + VIEWPORT_MARGIN)
+
+        text = self.text_widget.text
+        # Tk lays out whole lines, so a multi-megabyte line is only ever handed over in slices
+        self.sliced = self.doc.index.longest > LONG_LINE_BYTES
+        if self.sliced:
+            self.text_widget.set_text(self.doc.get_line_slices(start, end, self.h_offset, SLICE_BYTES))
+            text.xview_moveto(0)
+        else:
+            self.text_widget.set_text(self.doc.cached_lines(start, end))
+        self.window_start = start
+        self.window_end = end
+        self.update_column_indicator()
+
+        self.text_widget.first_line = start + 1
+        text.yview(f"{top - start + 1}.0")
+        self.text_widget.update_line_numbers()
+        # Replacing the text dropped every tag
+        self.highlighted = None
+        self.update_highlights()
+
+    def show_line(self, line):
+        if self.window_start <= line and line + self.visible_rows() <= self.window_end:
+            self.text_widget.text.yview(f"{line - self.window_start + 1}.0")
+        else:
+            self.load_window(line)
+
+    def on_v_scrollbar(self, *args):
+        if self.active and args[0] == 'moveto':
+            self.show_line(int(float(args[1]) * self.doc.line_count))
+        else:
+            self.text_widget.text.yview(*args)
+
+    def on_text_scroll(self, *args):
+        # Tk reports every step of a scroll; the rest of the view catches up once per idle pass
+        if self.active and self.scroll_job is None:
+            self.scroll_job = self.after_idle(self.sync_scroll)
+
+    @timed
+    def sync_scroll(self):
+        self.scroll_job = None
+        if not self.active:
+            # Emptied on deactivation; nothing to slide or number
+            return
+
+        # Slide the decoded window along once the view gets close to either edge
+        top = self.top_line()
+        rows = self.visible_rows()
+        near_start = self.window_start > 0 and top - self.window_start < VIEWPORT_MARGIN // 2
+        near_end = (self.window_end < self.doc.line_count
+                    and self.window_end - (top + rows) < VIEWPORT_MARGIN // 2)
+        if near_start or near_end:
+            self.load_window(top)
+        else:
+            self.text_widget.update_line_numbers()
+            self.update_highlights()
+
+        self.update_scroll_position(top, rows)
+
+    def on_h_scrollbar(self, *args):
+        if not self.sliced:
+            self.text_widget.text.xview(*args)
+            return
+        if args[0] == 'moveto':
+            offset = int(float(args[1]) * self.doc.index.longest)
+        elif args[2] == 'pages':
+            offset = self.h_offset + int(args[1]) * SLICE_BYTES // 2
+        else:
+            offset = self.h_offset + int(args[1]) * SCROLL_UNIT_BYTES
+        self.set_h_offset(offset)
+
+    def set_h_offset(self, offset):
+        offset = max(0, min(offset, self.doc.index.longest - SLICE_BYTES // 2))
+        self.h_offset = offset - offset % self.doc.codec.unit
+        self.load_window(self.top_line())
+
+    def on_text_xscroll(self, first, last):
+        if not self.sliced:
+            self.h_scrollbar.set(first, last)
+            return
+        longest = max(1, self.doc.index.longest)
+        self.h_scrollbar.set(self.h_offset / longest, min(1.0, (self.h_offset + SLICE_BYTES) / longest))
+
+    def update_column_indicator(self):
+        if self.sliced:
+            self.set_column_status(f"Long lines: bytes {self.h_offset:,}-{self.h_offset + SLICE_BYTES:,} "
+                                   f"of up to {self.doc.index.longest:,}")
+        else:
+            self.set_column_status('')
+
+    def update_scroll_position(self, top, rows):
+        count = max(1, self.doc.line_count)
+        self.v_scrollbar.set(top / count, min(1.0, (top + rows) / count))
+        self.update_nav_slider()
+
+    def update_nav_slider(self):
+        self.nav_slider.set(self.top_line() * 100 / max(1, self.doc.line_count))
+        # As the scale formats it, which is how its callback will hand it back
+        self.slider_value = self.nav_slider.get()
+
+    @timed
+    def on_nav_slider_move(self, value):
+        if not self.active:
+            return
+
+        # The scale calls back after our own set too; only a value we did not put there moves the view
+        value = float(value)
+        if value == self.slider_value:
+            return
+        self.slider_value = value
+        self.show_line(int(value * self.doc.line_count / 100))
+
+    def scroll_to_end(self):
+        self.show_line(max(0, self.doc.line_count - self.visible_rows()))
+
+    def toggle_follow(self):
+        if self.app.follow_var.get():
+            if self.doc.index.complete:
+                self.scroll_to_end()
+            self.schedule_follow()
+
+    def schedule_follow(self):
+        if self.follow_job is not None:
+            self.after_cancel(self.follow_job)
+        self.follow_job = self.after(FOLLOW_POLL_MS, self.poll_follow, self.doc)
+
+    def poll_follow(self, doc):
+        self.follow_job = None
+        if doc is not self.doc or not self.active or not self.app.follow_var.get():
+            return
+
+        old_count = doc.line_count
+        rows = self.visible_rows()
+        pinned = self.top_line() + rows >= old_count
+        change = doc.refresh()
+        if change in (TRUNCATED, REPLACED):
+            # Truncated or rotated away: whatever is at the path now is a new file
+            self.app.open_path(doc.path, self)
+            return
+
+        if change == GROWN:
+            if pinned:
+                self.scroll_to_end()
+            elif self.window_end >= old_count - 1:
+                # The window holds the old last line, which may have been extended
+                self.load_window(self.top_line())
+            self.update_scroll_position(self.top_line(), rows)
+            self.set_status(f"{doc.description} - {doc.line_count:,} lines")
+
+        # Carry a finished search on over appended bytes, including any that arrived while it was running
+        if self.matches is not None and self.matches.complete and self.matches.scanned_to < doc.size:
+            self.search_worker = doc.search_in_background(self.last_search, self.matches, **self.search_options)
+            self.poll_search(self.search_worker)
+        self.schedule_follow()
+
+    def poll_index(self, doc):
+        if doc is not self.doc:
+            return
+
+        # Fill the viewport as soon as the lines it needs have been indexed
+        if self.active:
+            top = self.top_line()
+            rows = self.visible_rows()
+            if self.window_end < min(doc.line_count, top + rows + VIEWPORT_MARGIN):
+                self.load_window(top)
+            self.update_scroll_position(top, rows)
+
+        if doc.index.complete:
+            self.set_loading(None)
+            self.set_status(f"{doc.description} - {doc.line_count:,} lines")
+            if self.active and self.app.follow_var.get():
+                self.scroll_to_end()
+        elif not doc.builder.is_alive():
+            self.set_loading(None)
+            self.set_status(f"{doc.description} - stopped at {doc.index.progress:.0%} - {doc.line_count:,} lines")
+        else:
+            self.set_loading(doc.index.progress)
+            self.set_status(f"{doc.description} - indexing {doc.index.progress:.0%} - {doc.line_count:,} lines")
+            self.after(INDEX_POLL_MS, self.poll_index, doc)
+
+    def stop_loading(self):
+        # Lines indexed so far stay readable and searchable; the rest of the file is left out
+        if self.doc is not None and self.doc.builder is not None:
+            self.doc.builder.cancel()
+            self.poll_index(self.doc)
+
+    def reveal(self, start, end):
+        """Bring bytes [start, end) into the viewport; returns their text widget indices."""
+        line = self.doc.line_of_offset(start)
+        end_line = self.doc.line_of_offset(end)
+        reload = line < self.window_start or end_line >= self.window_end
+        top = max(0, line - self.visible_rows() // 2) if reload else self.top_line()
+        if self.doc.index.longest > LONG_LINE_BYTES:
+            # Move the slice so the match starts in its first half
+            column = start - self.doc.line_start(line)
+            if reload or not self.sliced or not self.h_offset <= column < self.h_offset + SLICE_BYTES // 2:
+                self.h_offset = max(0, column - SLICE_BYTES // 8)
+                self.h_offset -= self.h_offset % self.doc.codec.unit
+                reload = True
+        if reload:
+            self.load_window(top)
+
+        return self.text_index(start), self.text_index(end)
+
+    def text_index(self, offset):
+        # Only valid for offsets on lines of the decoded window
+        if self.sliced:
+            line, col = self.doc.column_in_slice(offset, self.h_offset, SLICE_BYTES)
+        else:
+            line, col = self.doc.column_of_offset(offset)
+        return f"{line - self.window_start + 1}.{col}"
+
+    def byte_offset(self, index):
+        # The inverse of text_index
+        row, col = (int(part) for part in index.split('.'))
+        line = self.window_start + row - 1
+        if line >= self.doc.line_count:
+            return self.doc.line_end(self.doc.line_count - 1)
+        if self.sliced:
+            lo, hi = self.doc.slice_bounds(line, self.h_offset, SLICE_BYTES)
+            return lo + len(self.doc.codec.encode(self.doc.codec.decode(self.doc.mm, lo, hi)[:col]))
+        return self.doc.offset_of_column(line, col)
+
+    def show_match(self, start, end):
+        pos, end_pos = self.reveal(start, end)
+        text = self.text_widget.text
+        text.tag_remove('search', '1.0', tk.END)
+        text.tag_add('search', pos, end_pos)
+        text.see(pos)
+        self.update_nav_slider()
+
+    def show_span(self, doc, start, end):
+        """Highlight bytes [start, end) of doc once the index reaches them."""
+        if doc is not self.doc:
+            return
+        if not doc.index.covers(end):
+            self.after(INDEX_POLL_MS, self.show_span, doc, start, end)
+        elif self.active:
+            self.show_match(start, end)
+        else:
+            self.saved_top = max(0, doc.line_of_offset(start) - self.visible_rows() // 2)
+
+    def go_to(self, position):
+        """Put the cursor at a line, @byte offset or percentage, as understood by Document.resolve_position."""
+        try:
+            offset = self.doc.resolve_position(position)
+        except ValueError as e:
+            messagebox.showerror("Go To", str(e))
+            return
+        pos, _ = self.reveal(offset, offset)
+        text = self.text_widget.text
+        text.mark_set(tk.INSERT, pos)
+        text.see(pos)
+        text.focus_set()
+        self.update_nav_slider()
+
+    def clear_highlights(self):
+        self.text_widget.text.tag_remove('match', '1.0', tk.END)
+        self.highlighted = None
+
+    @timed
+    def update_highlights(self, refresh=False):
+        """Tag the matches on the rows in view when Highlight All is on.
+
+        Rows still in view keep their tags from the last call; only rows
+        scrolled in are tagged and only rows scrolled out are cleared.
+        refresh retags everything in view, for when more matches arrive.
+        Rows left untagged when MAX_VISIBLE_HIGHLIGHTS runs out are not
+        counted as highlighted.
+        """
+        if not self.active or self.matches is None or not self.app.highlight_var.get():
+            if self.highlighted is not None:
+                self.clear_highlights()
+            return
+        top = self.top_line()
+        first = max(self.window_start, top)
+        last = min(self.window_end, top + self.visible_rows() + 1)
+        if first >= last:
+            return
+
+        old = self.highlighted
+        if refresh or old is None or old[1] <= first or last <= old[0]:
+            self.clear_highlights()
+            added = [(first, last)]
+        else:
+            text = self.text_widget.text
+            for lo, hi in ((old[0], first), (last, old[1])):
+                if lo < hi:
+                    text.tag_remove('match', f"{lo - self.window_start + 1}.0", f"{hi - self.window_start + 1}.0")
+            added = [(lo, hi) for lo, hi in ((first, old[0]), (old[1], last)) if lo < hi]
+        self.highlighted = (first, last)
+
+        text = self.text_widget.text
+        budget = MAX_VISIBLE_HIGHLIGHTS
+        for lo, hi in added:
+            for start, end in self.matches.between(self.doc.line_start(lo), self.doc.line_end(hi - 1)):
+                if budget == 0:
+                    # Only the rows above this match are done; the next call carries on from there
+                    self.highlighted = (first, self.doc.line_of_offset(start))
+                    return
+                budget -= 1
+                text.tag_add('match', self.text_index(start), self.text_index(end))
+
+    def cancel_search(self):
+        if self.search_worker is not None:
+            self.search_worker.cancel()
+            self.search_worker = None
+        self.clear_highlights()
+        self.matches = None
+        self.minimap.show(None, 0)
+        self.minimap_drawn_at = 0
+        self.pending_jump = None
+        self.search_offset = None
+        self.last_search = None
+        self.search_options = None
+
+    def cancel_export(self):
+        if self.export is not None:
+            self.export.cancel()
+            self.export = None
+
+    def export_selection(self):
+        text = self.text_widget.text
+        if not text.tag_ranges(tk.SEL):
+            messagebox.showinfo("Export Selection", "Select some text first.")
+            return
+        span = (self.byte_offset(text.index(tk.SEL_FIRST)), self.byte_offset(text.index(tk.SEL_LAST)))
+        self.ask_export([span], span)
+
+    def export_lines(self):
+        top = self.top_line()
+        answer = simpledialog.askstring("Export Lines", "Lines to export (first-last, counting from 1):",
+                                        initialvalue=f"{top + 1}-{min(self.doc.line_count, top + self.visible_rows())}",
+                                        parent=self)
+        if not answer:
+            return
+        try:
+            first, last = parse_range(answer.replace(',', '').replace(' ', ''))
+        except ValueError:
+            first = last = 0
+        if not 1 <= first <= last <= self.doc.line_count:
+            messagebox.showerror("Export Lines", f"Not a range within the {self.doc.line_count:,} lines "
+                                                 f"indexed so far: {answer}")
+            return
+        span = line_span(self.doc, first - 1, last)
+        self.ask_export([span], span)
+
+    def export_matches(self):
+        if self.matches is None or not self.matches.complete:
+            messagebox.showinfo("Export Matching Lines", "Search for something first and let the search finish.")
+            return
+        self.ask_export(matching_line_spans(self.doc, self.matches))
+
+    def ask_export(self, spans, extent=None):
+        path = filedialog.asksaveasfilename(parent=self, title="Export To")
+        if not path:
+            return
+        self.cancel_export()
+        self.export = Export(self.doc, spans, path, extent)
+        self.export.start()
+        self.poll_export(self.export)
+
+    def poll_export(self, export):
+        if export is not self.export:
+            return
+        if export.is_alive():
+            self.set_status(f"Exporting to {os.path.basename(export.path)} {export.progress:.0%}")
+            self.after(INDEX_POLL_MS, self.poll_export, export)
+            return
+        self.export = None
+        if export.error is not None:
+            messagebox.showerror("Export Error", str(export.error))
+        else:
+            self.set_status(f"Exported {export.written:,} bytes to {export.path}")
+
+    def cancel_fields(self):
+        if self.field_extractor is not None:
+            self.field_extractor.cancel()
+            self.field_extractor = None
+        self.fields = None
+
+    def extract_fields(self):
+        """Parse the fields of lines indexed since the last call in the background."""
+        if self.fields is None:
+            self.fields = FieldTable()
+        if (self.fields.parsed < self.doc.line_count
+                and (self.field_extractor is None or not self.field_extractor.is_alive())):
+            self.field_extractor = FieldExtractor(self.doc, self.fields)
+            self.field_extractor.start()
+        return self.field_extractor
+
+    def prepare_search(self, search_term):
+        # Matches are collected once per query in the background; Next and Previous bisect into them
+        options = self.app.search_options()
+        if self.last_search == search_term and self.search_options == options:
+            return True
+        self.cancel_search()
+        try:
+            worker = self.doc.search_in_background(search_term, **options)
+        except re.error as e:
+            messagebox.showerror("Search Error", f"Invalid pattern: {e}")
+            return False
+        self.search_worker = worker
+        self.matches = worker.matches
+        self.last_search = search_term
+        self.search_options = options
+        self.minimap.show(worker.matches, self.doc.size)
+        self.poll_search(worker)
+        return True
+
+    def poll_search(self, worker):
+        if worker is not self.search_worker:
+            return
+        self.resolve_pending_jump()
+        self.update_search_status()
+        self.update_highlights(refresh=True)
+
+        # The histogram is cheap but not free, so refresh it less often than the counter
+        now = time.monotonic()
+        if worker.matches.complete or now - self.minimap_drawn_at >= MINIMAP_REDRAW_MS / 1000:
+            self.minimap.redraw()
+            self.minimap_drawn_at = now
+        if not worker.matches.complete:
+            self.after(SEARCH_POLL_MS, self.poll_search, worker)
+
+    def on_minimap_select(self, start, end):
+        if self.matches is None:
+            return
+        span = self.matches.next_after(start - 1)
+        if span is None or span[0] >= end:
+            return
+        if not self.doc.index.covers(span[1]):
+            messagebox.showinfo("Search Result", "That match is past the part of the file indexed so far.")
+            return
+        self.pending_jump = None
+        self.show_search_result(span)
+
+    def update_search_status(self):
+        matches = self.matches
+        if self.search_offset is None:
+            status = f"{len(matches):,} matches"
+        else:
+            status = f"Match {matches.rank(self.search_offset):,} of {len(matches):,}"
+        if not matches.complete:
+            status += f" (searching {matches.scanned_to / max(1, self.doc.size):.0%})"
+        self.set_status(status)
+
+    def resolve_pending_jump(self):
+        # Matches arrive in file order, so a jump can be answered as soon as its side is scanned
+        if self.pending_jump == 'next':
+            span = self.doc.next_match(self.matches, self.search_offset)
+            if span is PENDING:
+                return
+            self.pending_jump = None
+            if span and not self.doc.index.covers(span[1]):
+                messagebox.showinfo("Search Result", "The next match is past the part of the file indexed so far.")
+            elif span:
+                self.show_search_result(span)
+            else:
+                messagebox.showinfo("Search Result", "No more occurrences found.")
+                self.search_offset = None
+
+        elif self.pending_jump == 'previous':
+            span = self.doc.previous_match(self.matches, self.search_offset)
+            if span is PENDING:
+                return
+            self.pending_jump = None
+            if span:
+                self.show_search_result(span)
+            else:
+                messagebox.showinfo("Search Result", "No more occurrences found.")
+                self.search_offset = None
+
+    def show_search_result(self, span):
+        self.show_match(*span)
+        self.search_offset = span[0]
+        self.update_search_status()
+
+    @timed
+    def search_next(self, search_term):
+        if not self.prepare_search(search_term):
+            return
+        self.pending_jump = 'next'
+        self.resolve_pending_jump()
+
+    @timed
+    def search_previous(self, search_term):
+        if not self.prepare_search(search_term):
+            return
+        self.pending_jump = 'previous'
+        self.resolve_pending_jump()
+
+
+class FastTextReader(tk.Tk):
+    def __init__(self, index_cache=None):
+        super().__init__()
+        # Shared by every Document opened; None gives each the default on-disk cache
+        self.index_cache = index_cache
+
+        self.title("Fast Text Reader")
+        self.geometry("800x600")
+
+        # Create menu
+        self.create_menu()
+
+        # Create search frame
+        self.create_search_frame()
+
+        # Create status bar
+        self.create_status_bar()
+
+        # Create one tab per open file
+        self.notebook = ttk.Notebook(self)
+        self.notebook.pack(expand=True, fill='both')
+        self.notebook.bind('<<NotebookTabChanged>>', self.on_tab_changed)
+        self.current_view = None
 
     def create_menu(self):
         menubar = tk.Menu(self)
@@ -73,9 +1058,38 @@ class FastTextReader(tk.Tk):
 
         file_menu = tk.Menu(menubar, tearoff=0)
         file_menu.add_command(label="Open", command=self.open_file)
+        file_menu.add_command(label="Close Tab", command=self.close_tab)
+        file_menu.add_separator()
+        file_menu.add_command(label="Export Selection...", command=self.export_selection)
+        file_menu.add_command(label="Export Lines...", command=self.export_lines)
+        file_menu.add_command(label="Export Matching Lines...", command=self.export_matches)
+        file_menu.add_separator()
         file_menu.add_command(label="Exit", command=self.quit)
         menubar.add_cascade(label="File", menu=file_menu)
 
+        self.follow_var = tk.BooleanVar(value=False)
+        view_menu = tk.Menu(menubar, tearoff=0)
+        view_menu.add_checkbutton(label="Follow", variable=self.follow_var, command=self.toggle_follow)
+        self.highlight_var = tk.BooleanVar(value=False)
+        view_menu.add_checkbutton(label="Highlight All", variable=self.highlight_var, command=self.toggle_highlight)
+        # Spends disk and a background pass on large files to make repeated searches fast
+        self.trigram_var = tk.BooleanVar(value=False)
+        view_menu.add_checkbutton(label="Trigram Index", variable=self.trigram_var, command=self.reopen)
+
+        # An empty encoding means sniff it from the file
+        self.encoding_var = tk.StringVar(value='')
+        encoding_menu = tk.Menu(view_menu, tearoff=0)
+        for label, encoding in ENCODINGS:
+            encoding_menu.add_radiobutton(label=label, value=encoding, variable=self.encoding_var,
+                                          command=self.reopen)
+        view_menu.add_cascade(label="Encoding", menu=encoding_menu)
+        view_menu.add_command(label="Go To...", command=self.go_to, accelerator="Ctrl+G")
+        self.bind('<Control-g>', self.go_to)
+        view_menu.add_command(label="Filter Lines...", command=self.show_filter)
+        if INSTRUMENTED:
+            view_menu.add_command(label="Performance", command=self.show_stats)
+        menubar.add_cascade(label="View", menu=view_menu)
+
     def create_search_frame(self):
         search_frame = tk.Frame(self)
         search_frame.pack(side=tk.TOP, fill=tk.X)
@@ -93,107 +1107,200 @@ class FastTextReader(tk.Tk):
         prev_button = tk.Button(search_frame, text="Previous", command=self.search_previous)
         prev_button.pack(side=tk.LEFT)
 
-    def create_navigation_slider(self):
-        self.nav_slider = tk.Scale(self.content_frame, from_=0, to=100, orient=tk.VERTICAL, 
-                                   command=self.on_nav_slider_move)
-        self.nav_slider.pack(side=tk.LEFT, fill=tk.Y)
+        files_button = tk.Button(search_frame, text="In Files...", command=self.search_in_files)
+        files_button.pack(side=tk.LEFT)
 
-    def create_text_widget(self):
-        self.text_widget = LineNumberedText(self.content_frame)
-        self.text_widget.pack(side=tk.LEFT, expand=True, fill='both')
+        # Plain text without regex syntax is searched as a literal either way, which is faster
+        self.regex_var = tk.BooleanVar(value=True)
+        tk.Checkbutton(search_frame, text="Regex", variable=self.regex_var).pack(side=tk.LEFT)
+        self.case_var = tk.BooleanVar(value=True)
+        tk.Checkbutton(search_frame, text="Match Case", variable=self.case_var).pack(side=tk.LEFT)
+        self.word_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(search_frame, text="Whole Word", variable=self.word_var).pack(side=tk.LEFT)
+        self.files_spec = ''
 
-    def create_scrollbars(self):
-        self.v_scrollbar = tk.Scrollbar(self.content_frame, orient='vertical', command=self.text_widget.text.yview)
-        self.v_scrollbar.pack(side=tk.RIGHT, fill='y')
-        self.text_widget.text.configure(yscrollcommand=self.on_text_scroll)
+    def create_status_bar(self):
+        status_frame = tk.Frame(self)
+        status_frame.pack(side=tk.BOTTOM, fill=tk.X)
+        self.status_var = tk.StringVar()
+        status_bar = tk.Label(status_frame, textvariable=self.status_var, anchor='w', relief=tk.SUNKEN)
+        status_bar.pack(side=tk.LEFT, expand=True, fill=tk.X)
 
-        h_scrollbar = tk.Scrollbar(self, orient='horizontal', command=self.text_widget.text.xview)
-        h_scrollbar.pack(side=tk.BOTTOM, fill='x')
-        self.text_widget.text.configure(xscrollcommand=h_scrollbar.set)
+        # Which part of long lines is on screen, in sliced mode only
+        self.column_var = tk.StringVar()
+        column_label = tk.Label(status_frame, textvariable=self.column_var, anchor='e', relief=tk.SUNKEN)
+        column_label.pack(side=tk.RIGHT)
 
-    def on_text_scroll(self, *args):
-        self.v_scrollbar.set(*args)
-        self.update_nav_slider()
-        self.text_widget.linenumbers.yview_moveto(args[0])
+        # Shown only while the selected tab is still being indexed
+        self.load_progress = ttk.Progressbar(status_frame, length=120, maximum=1.0)
+        self.stop_button = tk.Button(status_frame, text="Stop", command=self.stop_loading)
 
-    def update_nav_slider(self):
-        first, last = self.text_widget.text.yview()
-        self.nav_slider.set(first * 100)
+    def set_loading(self, progress):
+        """Show indexing progress (0-1) in the status bar, or hide it for None."""
+        if progress is None:
+            self.load_progress.pack_forget()
+            self.stop_button.pack_forget()
+            return
+        self.load_progress['value'] = progress
+        if not self.load_progress.winfo_manager():
+            self.stop_button.pack(side=tk.RIGHT)
+            self.load_progress.pack(side=tk.RIGHT, padx=4)
 
-    def on_nav_slider_move(self, value):
-        self.text_widget.text.yview_moveto(float(value) / 100)
-        self.text_widget.linenumbers.yview_moveto(float(value) / 100)
+    def stop_loading(self):
+        view = self.active_view()
+        if view is not None:
+            view.stop_loading()
+
+    def active_view(self):
+        selected = self.notebook.select()
+        return self.nametowidget(selected) if selected else None
+
+    def on_tab_changed(self, event):
+        view = self.active_view()
+        if view is self.current_view:
+            return
+        if self.current_view is not None:
+            self.current_view.deactivate()
+        self.current_view = view
+        if view is None:
+            self.status_var.set('')
+            self.column_var.set('')
+            self.set_loading(None)
+        else:
+            view.activate()
 
     def open_file(self):
-        file_path = filedialog.askopenfilename(filetypes=[("Text files", "*.txt"), ("All files", "*.*")])
+        file_path = filedialog.askopenfilename(filetypes=[("Text files", "*.txt"),
+                                                          ("Compressed logs", "*.gz *.bz2 *.xz *.zst"),
+                                                          ("All files", "*.*")])
         if file_path:
-            try:
-                with open(file_path, 'rb') as file:
-                    mmapped_file = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
-                    content = mmapped_file.read().decode('utf-8')
-                    
-                    self.text_widget.text.delete('1.0', tk.END)
-                    self.text_widget.text.insert(tk.END, content)
-                    mmapped_file.close()
-                self.text_widget.update_line_numbers()
-                self.update_nav_slider()
-            except Exception as e:
-                messagebox.showerror("Error", f"Error opening file: {e}")
+            self.open_path(file_path)
 
-    def search_next(self):
-        search_term = self.search_var.get()
-        if search_term == "":
+    def show_stats(self):
+        StatsPanel(self)
+
+    def go_to(self, event=None):
+        view = self.active_view()
+        if view is None:
             return
+        position = simpledialog.askstring("Go To", "Line number, @byte offset or percentage\n"
+                                          "(e.g. 120000, @0x4000, 37.5%):", parent=self)
+        if position:
+            view.go_to(position)
 
-        if self.last_search != search_term:
-            self.search_start = "1.0"
-            self.last_search = search_term
+    def show_filter(self):
+        view = self.active_view()
+        if view is not None:
+            FilterPanel(self, view)
 
-        start_pos = self.search_start
-        if start_pos == "1.0":
-            start_pos = self.text_widget.text.index(start_pos)
-        else:
-            start_pos = self.text_widget.text.index(f"{start_pos}+1c")
+    def reopen(self):
+        view = self.active_view()
+        if view is not None:
+            self.open_path(view.doc.path, view)
 
-        pos = self.text_widget.text.search(search_term, start_pos, stopindex=tk.END, regexp=True)
-        if pos:
-            line, col = pos.split('.')
-            end_pos = f"{line}.{int(col) + len(search_term)}"
-            self.text_widget.text.tag_remove('search', '1.0', tk.END)
-            self.text_widget.text.tag_add('search', pos, end_pos)
-            self.text_widget.text.tag_config('search', background='yellow')
-            self.text_widget.text.see(pos)
-            self.search_start = end_pos
-            self.update_nav_slider()
+    @timed
+    def open_path(self, file_path, view=None):
+        """Open file_path in view, or in a new tab if view is None."""
+        try:
+            doc = Document(file_path, encoding=self.encoding_var.get() or None,
+                           index_cache=self.index_cache, use_trigrams=self.trigram_var.get())
+            # Adding the first tab selects it at once, so the view needs its document before that
+            if view is None:
+                view = DocumentView(self.notebook, self)
+                view.set_document(doc)
+                self.notebook.add(view, text=os.path.basename(file_path))
+            else:
+                view.set_document(doc)
+                self.notebook.tab(view, text=os.path.basename(file_path))
+            self.notebook.select(view)
+        except Exception as e:
+            messagebox.showerror("Error", f"Error opening file: {e}")
+
+    def open_hit(self, path, start=None, end=None):
+        """Show path, selecting an existing tab for it if there is one, and highlight [start, end)."""
+        for name in self.notebook.tabs():
+            view = self.nametowidget(name)
+            if os.path.realpath(view.doc.path) == os.path.realpath(path):
+                self.notebook.select(view)
+                break
         else:
-            messagebox.showinfo("Search Result", "No more occurrences found.")
-            self.search_start = "1.0"
+            self.open_path(path)
+            view = self.active_view()
+            if view is None or view.doc.path != path:
+                # Opening failed and has been reported
+                return
+        if start is not None:
+            view.show_span(view.doc, start, end)
 
-    def search_previous(self):
+    def search_in_files(self):
         search_term = self.search_var.get()
         if search_term == "":
             return
+        spec = simpledialog.askstring("Search in Files", "Directory or glob (** matches subdirectories):",
+                                      initialvalue=self.files_spec, parent=self)
+        if not spec:
+            return
+        self.files_spec = spec
+        try:
+            search = FileSearch(spec, search_term, **self.search_options())
+        except re.error as e:
+            messagebox.showerror("Search Error", f"Invalid pattern: {e}")
+            return
+        FileSearchPanel(self, search)
 
-        if self.last_search != search_term:
-            self.search_start = tk.END
-            self.last_search = search_term
-
-        end_pos = self.text_widget.text.index(f"{self.search_start}-1c")
-        pos = self.text_widget.text.search(search_term, "1.0", stopindex=end_pos, regexp=True, backwards=True)
-        
-        if pos:
-            line, col = pos.split('.')
-            end_pos = f"{line}.{int(col) + len(search_term)}"
-            self.text_widget.text.tag_remove('search', '1.0', tk.END)
-            self.text_widget.text.tag_add('search', pos, end_pos)
-            self.text_widget.text.tag_config('search', background='yellow')
-            self.text_widget.text.see(pos)
-            self.search_start = pos
-            self.update_nav_slider()
-        else:
-            messagebox.showinfo("Search Result", "No more occurrences found.")
-            self.search_start = tk.END
+    def export_selection(self):
+        view = self.active_view()
+        if view is not None:
+            view.export_selection()
+
+    def export_lines(self):
+        view = self.active_view()
+        if view is not None:
+            view.export_lines()
+
+    def export_matches(self):
+        view = self.active_view()
+        if view is not None:
+            view.export_matches()
+
+    def close_tab(self):
+        view = self.active_view()
+        if view is None:
+            return
+        # Closed outright, so there is nothing to deactivate
+        self.current_view = None
+        view.close()
+        self.notebook.forget(view)
+        view.destroy()
+
+    def toggle_follow(self):
+        view = self.active_view()
+        if view is not None:
+            view.toggle_follow()
+
+    def search_options(self):
+        return {'literal': not self.regex_var.get(), 'ignore_case': not self.case_var.get(),
+                'whole_word': self.word_var.get()}
+
+    def toggle_highlight(self):
+        view = self.active_view()
+        if view is not None:
+            view.update_highlights(refresh=True)
+
+    def search_next(self):
+        search_term = self.search_var.get()
+        view = self.active_view()
+        if search_term == "" or view is None:
+            return
+        view.search_next(search_term)
+
+    def search_previous(self):
+        search_term = self.search_var.get()
+        view = self.active_view()
+        if search_term == "" or view is None:
+            return
+        view.search_previous(search_term)
 
 if __name__ == "__main__":
     app = FastTextReader()
-    app.mainloop()
\ No newline at end of file
+    profiled(app.mainloop)
\ No newline at end of file
@@ -0,0 +1,363 @@
+import argparse
+import json
+import mmap
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from index_cache import IndexCache
+from reader_core import PENDING, Document
+from search_engine import compile_pattern, find_all, find_all_parallel
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+LEVELS = ['DEBUG', 'INFO', 'INFO', 'INFO', 'WARN', 'ERROR']
+COMPONENTS = ['api', 'db', 'cache', 'auth', 'scheduler', 'worker']
+MESSAGES = [
+    'request {n} completed in {ms} ms',
+    'cache miss for key user:{n}',
+    'connection {n} closed by peer',
+    'retrying job {n} after timeout of {ms} ms',
+    'slow query took {ms} ms on shard {n}',
+]
+MULTIBYTE_TAGS = ['café', 'Größe', 'ошибка', '错误', 'ñandú', 'θέμα']
+# Records per line in long-line files, giving lines of roughly 2 MB; app5 slices lines past 64 KB
+LONG_LINE_RECORDS = 30000
+
+SHAPES = ['short', 'long']
+CHARSETS = ['ascii', 'multibyte']
+# What app5 decodes for a first screen: 50 rows plus VIEWPORT_MARGIN below
+FIRST_PAINT_LINES = 250
+VIEWPORT_ROWS = 50
+VIEWPORT_MARGIN = 200
+JUMPS = 50
+NEXT_MATCH_PROBES = 1000
+GUTTER_REDRAWS = 50
+# Timings that moved by more than this share are flagged by compare
+REGRESSION_THRESHOLD = 0.10
+
+
+def generate_log(path, size, seed=0, long_lines=False, multibyte=False):
+    """Write a synthetic log of roughly size bytes.
+
+    long_lines joins LONG_LINE_RECORDS records into each line; multibyte
+    tags every record with non-ASCII text.
+    """
+    rng = random.Random(seed)
+    written = 0
+    # Long lines run on across blocks
+    in_line = 0
+    with open(path, 'w', encoding='utf-8') as f:
+        while written < size:
+            records = []
+            for _ in range(10000):
+                message = rng.choice(MESSAGES).format(n=rng.randrange(10 ** 6), ms=rng.randrange(5000))
+                if multibyte:
+                    message += f" [{rng.choice(MULTIBYTE_TAGS)}]"
+                records.append(f"2024-05-{rng.randrange(1, 29):02d} {rng.randrange(24):02d}:"
+                               f"{rng.randrange(60):02d}:{rng.randrange(60):02d} "
+                               f"{rng.choice(LEVELS):<5} {rng.choice(COMPONENTS)} {message}")
+            if long_lines:
+                parts = []
+                for record in records:
+                    in_line = (in_line + 1) % LONG_LINE_RECORDS
+                    parts.append(record)
+                    parts.append(' | ' if in_line else '\n')
+                block = ''.join(parts)
+            else:
+                block = '\n'.join(records) + '\n'
+            f.write(block)
+            written += len(block.encode('utf-8')) if multibyte else len(block)
+        if in_line:
+            f.write('\n')
+
+
+def best_of(repeat, fn, *args, **kwargs):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def bench_search(args):
+    regex = compile_pattern(args.pattern)
+    with open(args.file, 'rb') as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        size_mb = len(mm) / (1024 * 1024)
+        print(f"{args.file}: {size_mb:.0f} MB, pattern {args.pattern!r}")
+
+        baseline, matches = best_of(args.repeat, find_all, mm, regex)
+        print(f"{'in-process':>12} {baseline:8.3f} s {size_mb / baseline:9.1f} MB/s   "
+              f"{len(matches):,} matches")
+
+        workers = 1
+        while workers <= args.max_workers:
+            with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+                # Start the workers before timing so only the scan is measured
+                list(executor.map(abs, range(workers)))
+                elapsed, parallel = best_of(args.repeat, find_all_parallel, args.file, mm, regex,
+                                            executor=executor, workers=workers)
+            assert parallel.starts == matches.starts
+            print(f"{workers:>4} workers {elapsed:8.3f} s {size_mb / elapsed:9.1f} MB/s   "
+                  f"x{baseline / elapsed:.2f}")
+            workers *= 2
+        mm.close()
+
+
+class NoIndexCache(IndexCache):
+    """An index cache that never hits, so every open is measured cold."""
+
+    def load(self, path, stat, encoding):
+        return None
+
+    def save(self, path, stat, encoding, index):
+        pass
+
+
+def synthetic_file(directory, size_mb, shape, charset):
+    # Generated files are kept in directory and reused by later runs
+    path = os.path.join(directory, f"synthetic-{size_mb}mb-{shape}-{charset}.log")
+    if not os.path.exists(path):
+        generate_log(path + '.tmp', size_mb * 1024 * 1024, long_lines=shape == 'long',
+                     multibyte=charset == 'multibyte')
+        os.replace(path + '.tmp', path)
+    return path
+
+
+def peak_rss_kb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, Linux kilobytes
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def measure_engine(path, pattern, rng):
+    result = {}
+    start = time.perf_counter()
+    doc = Document(path, index_cache=NoIndexCache())
+    builder = doc.build_index_in_background()
+    while doc.line_count < FIRST_PAINT_LINES and not doc.index.complete:
+        time.sleep(0.001)
+    doc.get_lines(0, FIRST_PAINT_LINES)
+    result['open_first_paint_s'] = time.perf_counter() - start
+    if builder is not None:
+        builder.join()
+    result['index_s'] = time.perf_counter() - start
+    result['bytes'] = doc.size
+    result['lines'] = doc.line_count
+
+    times = []
+    for _ in range(JUMPS):
+        line = rng.randrange(doc.line_count)
+        start = time.perf_counter()
+        doc.get_lines(line - VIEWPORT_MARGIN, line + VIEWPORT_ROWS + VIEWPORT_MARGIN)
+        times.append(time.perf_counter() - start)
+    result['jump_mean_s'] = sum(times) / len(times)
+    result['jump_max_s'] = max(times)
+
+    start = time.perf_counter()
+    matches = doc.search(pattern)
+    result['search_s'] = time.perf_counter() - start
+    result['matches'] = len(matches)
+
+    # What a user waits for after pressing Next on a new query
+    start = time.perf_counter()
+    worker = doc.search_in_background(pattern)
+    while doc.next_match(worker.matches) is PENDING:
+        time.sleep(0.0005)
+    result['first_match_s'] = time.perf_counter() - start
+    worker.cancel()
+
+    offsets = [rng.randrange(max(1, doc.size)) for _ in range(NEXT_MATCH_PROBES)]
+    start = time.perf_counter()
+    for offset in offsets:
+        doc.next_match(matches, offset)
+    result['next_match_s'] = (time.perf_counter() - start) / NEXT_MATCH_PROBES
+    doc.close()
+    return result
+
+
+def measure_gui(path, rng):
+    """Time the Tk viewer, or return None when there is no display (run under xvfb-run)."""
+    try:
+        import tkinter as tk
+    except ImportError:
+        return None
+    try:
+        from app5 import FastTextReader
+        # Cold opens, as measure_engine times them, and nothing written to the user's cache
+        app = FastTextReader(index_cache=NoIndexCache())
+    except tk.TclError:
+        return None
+    try:
+        app.update()
+        start = time.perf_counter()
+        app.open_path(path)
+        view = app.active_view()
+        text = view.text_widget.text
+        while text.compare('end-1c', '==', '1.0') and not view.doc.index.complete:
+            app.update()
+        app.update_idletasks()
+        result = {'gui_first_paint_s': time.perf_counter() - start}
+
+        while not view.doc.index.complete:
+            app.update()
+            time.sleep(0.01)
+        times = []
+        for _ in range(JUMPS):
+            start = time.perf_counter()
+            view.show_line(rng.randrange(view.doc.line_count))
+            app.update_idletasks()
+            times.append(time.perf_counter() - start)
+        result['gui_jump_mean_s'] = sum(times) / len(times)
+
+        start = time.perf_counter()
+        for _ in range(GUTTER_REDRAWS):
+            view.text_widget.update_line_numbers()
+        result['gutter_s'] = (time.perf_counter() - start) / GUTTER_REDRAWS
+        return result
+    finally:
+        app.destroy()
+
+
+def bench_case(args):
+    rng = random.Random(0)
+    result = measure_engine(args.file, args.pattern, rng)
+    if not args.no_gui:
+        result.update(measure_gui(args.file, rng) or {})
+    result['peak_rss_kb'] = peak_rss_kb()
+    json.dump(result, sys.stdout)
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def bench_suite(args):
+    directory = args.data_dir or tempfile.mkdtemp(prefix='ftr-bench-')
+    try:
+        cases = []
+        for size_mb in args.sizes_mb:
+            for shape in args.shapes:
+                for charset in args.charsets:
+                    path = synthetic_file(directory, size_mb, shape, charset)
+                    # A fresh process per file keeps peak RSS and warm caches per case
+                    command = [sys.executable, os.path.abspath(__file__), '--file', path, 'case',
+                               '--pattern', args.pattern]
+                    if args.no_gui:
+                        command.append('--no-gui')
+                    output = subprocess.run(command, stdout=subprocess.PIPE, text=True, check=True).stdout
+                    case = {'size_mb': size_mb, 'shape': shape, 'charset': charset}
+                    case.update(json.loads(output))
+                    cases.append(case)
+                    print(f"{size_mb:>6} MB {shape:>5} {charset:>9}  open {case['open_first_paint_s']:7.3f} s  "
+                          f"index {case['index_s']:7.3f} s  search {case['search_s']:7.3f} s  "
+                          f"first hit {case['first_match_s']:7.3f} s  rss {case['peak_rss_kb'] or 0:,} KB")
+    finally:
+        if args.data_dir is None:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    report = {
+        'commit': git_commit(),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'pattern': args.pattern,
+        'cases': cases,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"wrote {args.output}")
+
+
+def bench_compare(args):
+    with open(args.old) as f:
+        old = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+    key = lambda case: (case['size_mb'], case['shape'], case['charset'])
+    old_cases = {key(case): case for case in old['cases']}
+    regressions = 0
+    for case in new['cases']:
+        before = old_cases.get(key(case))
+        if before is None:
+            continue
+        for metric, value in case.items():
+            if not metric.endswith('_s') or before.get(metric) is None or value is None:
+                continue
+            ratio = value / max(before[metric], 1e-9)
+            flag = ''
+            if ratio > 1 + args.threshold:
+                flag = '  slower'
+                regressions += 1
+            elif ratio < 1 - args.threshold:
+                flag = '  faster'
+            print(f"{case['size_mb']:>6} MB {case['shape']:>5} {case['charset']:>9} {metric:>20} "
+                  f"{before[metric]:9.4f} -> {value:9.4f} s  x{ratio:.2f}{flag}")
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks for the Fast Text Reader engine")
+    parser.add_argument('--file', help="file to benchmark; a synthetic log is generated if omitted")
+    parser.add_argument('--size-mb', type=int, default=256, help="size of the generated log")
+    parser.add_argument('--repeat', type=int, default=3)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    search = subparsers.add_parser('search', help="in-process vs process-pool search throughput")
+    search.add_argument('--pattern', default=r'ERROR .*timeout')
+    search.add_argument('--max-workers', type=int, default=os.cpu_count() or 1)
+    search.set_defaults(run=bench_search, needs_file=True)
+
+    suite = subparsers.add_parser('suite', help="open, jump, search and gutter timings over synthetic files")
+    suite.add_argument('--sizes-mb', type=lambda value: [int(size) for size in value.split(',')],
+                       default=[10, 100], help="comma-separated file sizes, e.g. 10,100,1000,10240")
+    suite.add_argument('--shapes', nargs='+', choices=SHAPES, default=SHAPES)
+    suite.add_argument('--charsets', nargs='+', choices=CHARSETS, default=CHARSETS)
+    suite.add_argument('--pattern', default=r'ERROR .*timeout')
+    suite.add_argument('--data-dir', help="keep generated files here for later runs")
+    suite.add_argument('--output', default='benchmark.json')
+    suite.add_argument('--no-gui', action='store_true', help="skip the Tk timings")
+    suite.set_defaults(run=bench_suite, needs_file=False)
+
+    case = subparsers.add_parser('case', help="measure --file once and print JSON (used by suite)")
+    case.add_argument('--pattern', default=r'ERROR .*timeout')
+    case.add_argument('--no-gui', action='store_true')
+    case.set_defaults(run=bench_case, needs_file=True)
+
+    compare = subparsers.add_parser('compare', help="compare two suite reports, exit 1 on regressions")
+    compare.add_argument('old')
+    compare.add_argument('new')
+    compare.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD)
+    compare.set_defaults(run=bench_compare, needs_file=False)
+
+    args = parser.parse_args()
+    if args.file or not args.needs_file:
+        return args.run(args)
+    with tempfile.TemporaryDirectory() as directory:
+        args.file = os.path.join(directory, 'synthetic.log')
+        generate_log(args.file, args.size_mb * 1024 * 1024)
+        return args.run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
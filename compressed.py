@@ -0,0 +1,250 @@
+import bz2
+import lzma
+import os
+import threading
+import zlib
+from bisect import bisect_right
+from itertools import chain
+
+from instrumentation import timed
+from line_index import scan_newlines
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+READ_SIZE = 256 * 1024
+# Uncompressed distance between saved gzip decompressor states (~40 KB each)
+CHECKPOINT_SPACING = 8 * 1024 * 1024
+FIND_CHUNK_SIZE = 64 * 1024
+
+MAGIC = [
+    (b'\x1f\x8b', 'gzip'),
+    (b'BZh', 'bz2'),
+    (b'\xfd7zXZ\x00', 'xz'),
+    (b'\x28\xb5\x2f\xfd', 'zstd'),
+]
+
+
+def compression_format(path):
+    """Return the compression format of the file at path from its magic bytes, or None."""
+    with open(path, 'rb') as f:
+        head = f.read(8)
+    for magic, name in MAGIC:
+        if head.startswith(magic):
+            return name
+    return None
+
+
+def new_decompressor(name):
+    if name == 'gzip':
+        # 47 accepts both gzip and zlib headers
+        return zlib.decompressobj(47)
+    if name == 'bz2':
+        return bz2.BZ2Decompressor()
+    if name == 'xz':
+        return lzma.LZMADecompressor()
+    if name == 'zstd':
+        if zstandard is None:
+            raise ValueError("reading .zst files needs the zstandard package")
+        return zstandard.ZstdDecompressor().decompressobj()
+    raise ValueError(f"unsupported compression format: {name}")
+
+
+class CompressedBuffer:
+    """Random access to the uncompressed bytes of a compressed file.
+
+    A first sequential pass (build) records restart points: the start of
+    every compressed stream or frame, and for gzip a copy of the
+    decompressor state every CHECKPOINT_SPACING bytes. A read restarts
+    from the nearest point at or before it, or carries on from where the
+    previous read stopped, so nothing is ever inflated in full.
+
+    Slicing returns bytes, which with find and rfind is all the line
+    index, decoder and search need from a buffer that cannot be
+    memory-mapped.
+    """
+
+    def __init__(self, path, name):
+        self.path = path
+        self.name = name
+        self.copyable = name == 'gzip'
+        self.compressed_size = os.path.getsize(path)
+        self.compressed_pos = 0
+        self.length = 0
+        self.complete = False
+        # (uncompressed offset, compressed offset, decompressor state or None for a fresh one)
+        self.checkpoints = [(0, 0, None)]
+        self.checkpoint_offsets = [0]
+        self.cursor = None
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(self.length if self.complete else 2 ** 63)
+            if step != 1:
+                raise ValueError("CompressedBuffer slices must be contiguous")
+            return self.read(start, stop)
+        data = self.read(key, key + 1)
+        if not data:
+            raise IndexError(key)
+        return data[0]
+
+    def stream(self, out_pos, comp_pos, state):
+        """Yield (out_pos, data, restart point after data) decompressing from a restart point."""
+        decompressor = state.copy() if state is not None else new_decompressor(self.name)
+        pending = b''
+        with open(self.path, 'rb') as f:
+            f.seek(comp_pos)
+            while True:
+                raw = pending or f.read(READ_SIZE)
+                pending = b''
+                if not raw:
+                    return
+                if decompressor.eof:
+                    decompressor = new_decompressor(self.name)
+                    fresh = True
+                else:
+                    fresh = False
+                try:
+                    data = decompressor.decompress(raw)
+                except (OSError, EOFError, zlib.error, lzma.LZMAError):
+                    if fresh:
+                        # Padding or junk after the last complete stream
+                        return
+                    raise
+
+                if decompressor.eof:
+                    pending = decompressor.unused_data
+                    comp_pos += len(raw) - len(pending)
+                    restart = (out_pos + len(data), comp_pos, None)
+                else:
+                    comp_pos += len(raw)
+                    restart = (out_pos + len(data), comp_pos, decompressor)
+                yield out_pos, data, restart
+                out_pos += len(data)
+
+    def build(self, on_data, cancelled=None):
+        """Inflate the whole file once, recording restart points and passing each piece to on_data."""
+        last_checkpoint = 0
+        for out_pos, data, restart in self.stream(0, 0, None):
+            if cancelled is not None and cancelled.is_set():
+                return False
+            on_data(out_pos, data)
+            end, comp_pos, state = restart
+            if state is None or (self.copyable and end - last_checkpoint >= CHECKPOINT_SPACING):
+                with self.lock:
+                    if end > self.checkpoint_offsets[-1]:
+                        self.checkpoints.append((end, comp_pos, None if state is None else state.copy()))
+                        self.checkpoint_offsets.append(end)
+                last_checkpoint = end
+            self.length = end
+            self.compressed_pos = comp_pos
+        self.complete = True
+        return True
+
+    def read(self, start, end):
+        if start >= end:
+            return b''
+        with self.lock:
+            cursor = self.cursor
+            if cursor is not None and cursor[0] <= start < cursor[0] + len(cursor[1]) + CHECKPOINT_SPACING:
+                # Carry on from the previous read, which is typical for sequential scans
+                out_pos, data, stream = cursor
+                pieces = chain([(out_pos, data, None)], stream)
+            else:
+                checkpoint = self.checkpoints[bisect_right(self.checkpoint_offsets, start) - 1]
+                stream = pieces = self.stream(*checkpoint)
+
+            parts = []
+            self.cursor = None
+            for out_pos, data, _ in pieces:
+                piece_end = out_pos + len(data)
+                if piece_end <= start:
+                    continue
+                parts.append(data[max(0, start - out_pos):end - out_pos])
+                if piece_end >= end:
+                    self.cursor = (out_pos, data, stream)
+                    break
+            return b''.join(parts)
+
+    def find(self, sub, start=0, end=None):
+        if end is None:
+            end = self.length if self.complete else 2 ** 63
+        overlap = len(sub) - 1
+        pos = start
+        while pos < end:
+            chunk = self.read(pos, min(end, pos + FIND_CHUNK_SIZE + overlap))
+            if not chunk:
+                return -1
+            i = chunk.find(sub)
+            if i != -1:
+                return pos + i
+            pos += FIND_CHUNK_SIZE
+        return -1
+
+    def rfind(self, sub, start=0, end=None):
+        if end is None:
+            end = self.length
+        overlap = len(sub) - 1
+        pos = end
+        while pos > start:
+            lo = max(start, pos - FIND_CHUNK_SIZE)
+            i = self.read(lo, min(end, pos + overlap)).rfind(sub)
+            if i != -1:
+                return lo + i
+            pos = lo
+        return -1
+
+    @property
+    def progress(self):
+        if self.complete or self.compressed_size == 0:
+            return 1.0
+        return self.compressed_pos / self.compressed_size
+
+
+class CompressedIndexBuilder(threading.Thread):
+    """Drive the restart-point pass of a CompressedBuffer and line-index it on the way.
+
+    The uncompressed size is only known at the end, so until then the
+    index size is an estimate from the compression ratio so far.
+    """
+
+    def __init__(self, buf, index, on_finish=None, newline=b'\n'):
+        super().__init__(daemon=True)
+        self.buf = buf
+        self.index = index
+        self.on_finish = on_finish
+        self.newline = newline
+        self.cancelled = threading.Event()
+        self.carry = b''
+
+    def on_data(self, out_pos, data):
+        # Newlines are scanned on whole units, so a split UTF-16 unit waits for the next piece
+        data = self.carry + data
+        base = out_pos - len(self.carry)
+        usable = len(data) - len(data) % len(self.newline)
+        self.carry = data[usable:]
+        offsets = scan_newlines(data, 0, usable, self.newline, base)
+        if self.buf.compressed_pos:
+            self.index.size = max(base + usable, self.buf.compressed_size * (base + usable)
+                                  // self.buf.compressed_pos)
+        self.index.add_offsets(offsets, base + usable)
+
+    @timed
+    def run(self):
+        if not self.buf.build(self.on_data, self.cancelled):
+            return
+        self.index.size = len(self.buf)
+        self.index.finish()
+        if self.on_finish is not None:
+            self.on_finish()
+
+    def cancel(self):
+        self.cancelled.set()
+        if self.is_alive():
+            self.join()
@@ -0,0 +1,100 @@
+import codecs
+
+# Bytes sampled from the start of a file to guess its encoding
+SNIFF_SIZE = 64 * 1024
+# Share of undecodable UTF-8 sequences in the sample above which a file is read as Latin-1
+MAX_UTF8_ERROR_RATIO = 0.01
+DECODE_CHUNK_SIZE = 1024 * 1024
+DEFAULT_ERRORS = 'replace'
+
+BOMS = [
+    (codecs.BOM_UTF8, 'utf-8'),
+    (codecs.BOM_UTF16_LE, 'utf-16-le'),
+    (codecs.BOM_UTF16_BE, 'utf-16-be'),
+]
+
+
+def sniff_encoding(buf):
+    """Guess the encoding of buf; returns (encoding, bom_length)."""
+    for bom, encoding in BOMS:
+        if buf[:len(bom)] == bom:
+            return encoding, len(bom)
+
+    sample = bytes(buf[:SNIFF_SIZE])
+    if not sample:
+        return 'utf-8', 0
+
+    # BOM-less UTF-16 text is mostly ASCII with a NUL in every other byte
+    even_nuls = sample[0::2].count(0)
+    odd_nuls = sample[1::2].count(0)
+    if odd_nuls > len(sample) // 4 and even_nuls == 0:
+        return 'utf-16-le', 0
+    if even_nuls > len(sample) // 4 and odd_nuls == 0:
+        return 'utf-16-be', 0
+
+    # final=False so a sequence cut off by the end of the sample is not an error
+    decoder = codecs.getincrementaldecoder('utf-8')('replace')
+    text = decoder.decode(sample, final=False)
+    if text.count('�') <= len(sample) * MAX_UTF8_ERROR_RATIO:
+        return 'utf-8', 0
+    return 'latin-1', 0
+
+
+class TextCodec:
+    """How the bytes of one mapped file turn into text.
+
+    Decoding is incremental and never starts inside a multi-byte sequence,
+    so any byte window of a file can be shown on its own and a few bad
+    bytes only ever spoil the characters they belong to.
+    """
+
+    def __init__(self, encoding='utf-8', bom_length=0, errors=DEFAULT_ERRORS):
+        self.encoding = codecs.lookup(encoding).name
+        self.bom_length = bom_length
+        self.errors = errors
+        self.unit = 2 if self.encoding.startswith('utf-16') else 1
+        self.newline = '\n'.encode(self.encoding)
+
+    @classmethod
+    def detect(cls, buf, errors=DEFAULT_ERRORS):
+        encoding, bom_length = sniff_encoding(buf)
+        return cls(encoding, bom_length, errors)
+
+    def char_start(self, buf, pos):
+        """Move pos back to the start of the character it falls in."""
+        pos = max(pos, self.bom_length)
+        if self.unit == 2:
+            pos -= (pos - self.bom_length) % 2
+            # Step off the low half of a surrogate pair
+            if pos - 2 >= self.bom_length and pos + 1 < len(buf):
+                high = buf[pos + 1] if self.encoding == 'utf-16-le' else buf[pos]
+                if 0xDC <= high <= 0xDF:
+                    pos -= 2
+            return pos
+        if self.encoding == 'utf-8':
+            # Continuation bytes look like 0b10xxxxxx; a character has at most three of them
+            floor = max(self.bom_length, pos - 3)
+            while pos > floor and pos < len(buf) and buf[pos] & 0xC0 == 0x80:
+                pos -= 1
+        return pos
+
+    def decode(self, buf, start, end):
+        """Decode buf[start:end] in chunks, without copying the whole range first."""
+        decoder = codecs.getincrementaldecoder(self.encoding)(self.errors)
+        try:
+            view = memoryview(buf)
+        except TypeError:
+            # Not a real buffer (a CompressedBuffer); its slices are already copies
+            return decoder.decode(buf[start:end], final=True)
+        try:
+            parts = []
+            for pos in range(start, end, DECODE_CHUNK_SIZE):
+                parts.append(decoder.decode(view[pos:min(pos + DECODE_CHUNK_SIZE, end)]))
+            parts.append(decoder.decode(b'', final=True))
+            return ''.join(parts)
+        finally:
+            # A live export would stop the mapping from being closed or replaced
+            view.release()
+
+    def encode(self, text):
+        return text.encode(self.encoding)
@@ -0,0 +1,150 @@
+import errno
+import mmap
+import os
+import threading
+
+# Spans at least this long are copied file to file by the kernel; shorter ones are gathered in a buffer
+KERNEL_COPY_MIN = 1024 * 1024
+WRITE_BUFFER_SIZE = 4 * 1024 * 1024
+# Bytes per kernel copy call, so progress and cancellation keep up
+KERNEL_COPY_STEP = 64 * 1024 * 1024
+# Errors meaning the kernel cannot copy between these two files, rather than that the copy failed
+KERNEL_COPY_UNSUPPORTED = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.EBADF}
+
+
+def write_all(out, data):
+    view = memoryview(data)
+    while view:
+        view = view[out.write(view):]
+
+
+def kernel_copy(src, dst, offset, count):
+    """Copy up to count bytes at offset of fd src to the current position of fd dst; returns how many."""
+    if hasattr(os, 'copy_file_range'):
+        return os.copy_file_range(src, dst, count, offset)
+    return os.sendfile(dst, src, offset, count)
+
+
+def line_span(doc, first, last):
+    """Return the byte span of lines [first, last), newline included."""
+    return doc.line_start(first), doc.line_end(last - 1)
+
+
+def matching_line_spans(doc, matches):
+    """Yield the byte spans of the lines holding a match, newlines included; neighbouring lines share a span."""
+    newline = doc.codec.newline
+    run_start = run_end = None
+    for i in range(len(matches)):
+        start, _ = matches.span(i)
+        if run_end is not None and start < run_end:
+            # Another match on a line already taken
+            continue
+        lo, hi = doc.line_bounds(start)
+        if doc.mm[hi:hi + len(newline)] == newline:
+            hi += len(newline)
+        if lo == run_end:
+            run_end = hi
+            continue
+        if run_start is not None:
+            yield run_start, run_end
+        run_start, run_end = lo, hi
+    if run_start is not None:
+        yield run_start, run_end
+
+
+class Export(threading.Thread):
+    """Write byte spans of a document to a file, as stored, without decoding them.
+
+    Long spans of memory-mapped files go through copy_file_range (or
+    sendfile) so the data never enters Python. extent is the part of the
+    document the spans lie in, for progress; a UTF-16 byte order mark is
+    written first so the output decodes like the source. Call run() to
+    export in the calling thread or start() for a worker thread.
+    """
+
+    def __init__(self, doc, spans, path, extent=None):
+        super().__init__(daemon=True)
+        self.doc = doc
+        self.spans = spans
+        self.path = path
+        self.extent = extent if extent is not None else (0, doc.size)
+        self.position = self.extent[0]
+        self.written = 0
+        self.error = None
+        self.cancelled = threading.Event()
+        self.kernel_copy = isinstance(doc.mm, mmap.mmap)
+
+    @property
+    def progress(self):
+        lo, hi = self.extent
+        return 1.0 if hi <= lo else (self.position - lo) / (hi - lo)
+
+    def run(self):
+        try:
+            if os.path.exists(self.path) and os.path.samefile(self.path, self.doc.path):
+                # Truncating the source would pull the bytes out from under the memory map
+                self.error = OSError(errno.EINVAL, "cannot export a file onto itself", self.path)
+                return
+            with open(self.path, 'wb', buffering=0) as out:
+                self.export(out)
+        except OSError as e:
+            self.error = e
+        if self.error is not None or self.cancelled.is_set():
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+    def export(self, out):
+        mm = self.doc.mm
+        pending = bytearray(mm[:self.doc.codec.bom_length])
+        for start, end in self.spans:
+            if self.cancelled.is_set():
+                return
+            # The byte order mark is already out
+            start = max(start, self.doc.codec.bom_length)
+            if self.kernel_copy and end - start >= KERNEL_COPY_MIN:
+                write_all(out, pending)
+                self.written += len(pending)
+                pending.clear()
+                start = self.copy(out, start, end)
+            # Chunked so a long span through the buffer does not hold all of it in memory at once
+            for chunk in range(start, end, WRITE_BUFFER_SIZE):
+                if self.cancelled.is_set():
+                    return
+                pending += mm[chunk:min(end, chunk + WRITE_BUFFER_SIZE)]
+                if len(pending) >= WRITE_BUFFER_SIZE:
+                    write_all(out, pending)
+                    self.written += len(pending)
+                    pending.clear()
+                self.position = min(end, chunk + WRITE_BUFFER_SIZE)
+            self.position = end
+        write_all(out, pending)
+        self.written += len(pending)
+
+    def copy(self, out, start, end):
+        # Returns where the kernel stopped; the caller writes the rest itself
+        src, dst = self.doc.file.fileno(), out.fileno()
+        position = start
+        while position < end:
+            if self.cancelled.is_set():
+                return end
+            try:
+                copied = kernel_copy(src, dst, position, min(end - position, KERNEL_COPY_STEP))
+            except OSError as e:
+                if e.errno not in KERNEL_COPY_UNSUPPORTED:
+                    raise
+                copied = 0
+            if copied == 0:
+                # Not possible between these two files; stay with plain writes from here on
+                self.kernel_copy = False
+                return position
+            position += copied
+            self.written += copied
+            self.position = position
+        return end
+
+    def cancel(self):
+        self.cancelled.set()
+        if self.is_alive():
+            self.join()
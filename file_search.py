@@ -0,0 +1,171 @@
+import glob
+import lzma
+import os
+import queue
+import re
+import threading
+import zlib
+from concurrent.futures import FIRST_COMPLETED, wait
+
+from compressed import compression_format
+from decoding import sniff_encoding
+from reader_core import Document
+from search_engine import PARALLEL_WORKERS, RESULT_POLL_SECONDS, compile_pattern, find_all, get_executor
+
+# Bytes read from the start of a file to tell text from binary
+BINARY_SNIFF_SIZE = 8192
+# Files are handed to the process pool in batches so tiny files do not pay one round trip each
+BATCH_FILES = 64
+BATCH_BYTES = 64 * 1024 * 1024
+MAX_HITS_PER_FILE = 200
+SNIPPET_BEFORE = 60
+SNIPPET_AFTER = 140
+
+
+def expand_paths(spec):
+    """Return the files named by spec: a file, everything under a directory, or a glob (** recurses)."""
+    if os.path.isdir(spec):
+        paths = [os.path.join(root, name) for root, _, names in os.walk(spec) for name in names]
+    else:
+        paths = glob.glob(os.path.expanduser(spec), recursive=True)
+    return sorted(path for path in paths if os.path.isfile(path))
+
+
+def is_binary(path):
+    if compression_format(path) is not None:
+        return False
+    with open(path, 'rb') as f:
+        sample = f.read(BINARY_SNIFF_SIZE)
+    # UTF-16 text is full of NULs too, but in a pattern the sniffer recognises
+    return b'\0' in sample and not sniff_encoding(sample)[0].startswith('utf-16')
+
+
+def snippet(doc, start, end):
+    """Decode the part of the match's line around [start, end)."""
+    line_start, line_end = doc.line_bounds(start)
+    lo = max(line_start, doc.codec.char_start(doc.mm, start - SNIPPET_BEFORE))
+    hi = min(line_end, max(start, end) + SNIPPET_AFTER)
+    if hi < line_end:
+        hi = max(lo, doc.codec.char_start(doc.mm, hi))
+    return doc.codec.decode(doc.mm, lo, hi).strip()
+
+
+def search_file(path, pattern, max_hits=MAX_HITS_PER_FILE, **options):
+    """Return (match count, hits) for one file; hits are (line, start, end, snippet) of the first max_hits."""
+    with Document(path) as doc:
+        if doc.compression is not None:
+            # The uncompressed length is only known after one pass
+            doc.build_index()
+        matches = find_all(doc.mm, doc.compile(pattern, **options), unit=doc.codec.unit)
+        if not matches:
+            return 0, []
+        # Only files with hits pay for a line index
+        doc.build_index()
+        hits = []
+        for i in range(min(len(matches), max_hits)):
+            start, end = matches.span(i)
+            hits.append((doc.line_of_offset(start), start, end, snippet(doc, start, end)))
+        return len(matches), hits
+
+
+def search_batch(paths, pattern, cancelled=None, **options):
+    """Search paths in turn; returns (files searched, [(path, count, hits, error)]) for files with hits or errors."""
+    results = []
+    searched = 0
+    for path in paths:
+        if cancelled is not None and cancelled.is_set():
+            break
+        searched += 1
+        try:
+            if is_binary(path):
+                continue
+            count, hits = search_file(path, pattern, **options)
+        except (OSError, ValueError, EOFError, re.error, zlib.error, lzma.LZMAError) as e:
+            results.append((path, 0, [], str(e)))
+            continue
+        if count:
+            results.append((path, count, hits, None))
+    return searched, results
+
+
+def batches(paths):
+    batch = []
+    size = 0
+    for path in paths:
+        try:
+            size += os.path.getsize(path)
+        except OSError:
+            pass
+        batch.append(path)
+        if len(batch) >= BATCH_FILES or size >= BATCH_BYTES:
+            yield batch
+            batch = []
+            size = 0
+    if batch:
+        yield batch
+
+
+class FileSearch(threading.Thread):
+    """Search every file named by spec in the background.
+
+    Results are put on the results queue as (path, count, hits, error) as
+    soon as the batch holding them finishes; searched and total count
+    files for progress. Batches run in the shared process pool when there
+    is more than one CPU.
+    """
+
+    def __init__(self, spec, pattern, **options):
+        super().__init__(daemon=True)
+        # Fail on a bad pattern here rather than in every worker
+        compile_pattern(pattern, **options)
+        self.spec = spec
+        self.pattern = pattern
+        self.options = options
+        self.results = queue.Queue()
+        self.total = None
+        self.searched = 0
+        self.done = False
+        self.cancelled = threading.Event()
+
+    def add(self, batch_result):
+        searched, results = batch_result
+        for result in results:
+            self.results.put(result)
+        self.searched += searched
+
+    def run(self):
+        try:
+            paths = expand_paths(self.spec)
+            self.total = len(paths)
+            work = list(batches(paths))
+            if PARALLEL_WORKERS > 1 and len(work) > 1:
+                self.run_in_pool(work)
+            else:
+                for batch in work:
+                    if self.cancelled.is_set():
+                        break
+                    self.add(search_batch(batch, self.pattern, self.cancelled, **self.options))
+        finally:
+            self.done = True
+
+    def run_in_pool(self, work):
+        submitted = {get_executor().submit(search_batch, batch, self.pattern, **self.options): batch
+                     for batch in work}
+        pending = set(submitted)
+        try:
+            while pending and not self.cancelled.is_set():
+                finished, pending = wait(pending, timeout=RESULT_POLL_SECONDS, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        # The worker died or its results could not come back; count its files as unreadable
+                        batch = submitted[future]
+                        result = len(batch), [(path, 0, [], str(e) or type(e).__name__) for path in batch]
+                    self.add(result)
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def cancel(self):
+        self.cancelled.set()
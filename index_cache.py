@@ -0,0 +1,105 @@
+import hashlib
+import mmap
+import os
+import struct
+import sys
+
+from line_index import LineIndex
+
+CACHE_DIR = os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache')),
+                         'fast-text-reader', 'line-index')
+DEFAULT_CACHE_BYTES = 512 * 1024 * 1024
+# Small files index faster than the cache lookup costs
+MIN_CACHED_FILE_SIZE = 4 * 1024 * 1024
+
+MAGIC = b'FTRLIDX2'
+# magic, file size, line count, longest line
+HEADER = struct.Struct('8sQQQ')
+
+
+class IndexCache:
+    """Sidecar store of finished line indexes, evicted least recently used first.
+
+    Entries are raw native-endian uint64 arrays behind a small header so a
+    hit can be memory-mapped instead of read.
+    """
+
+    def __init__(self, directory=CACHE_DIR, max_bytes=DEFAULT_CACHE_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def entry_path(self, path, stat, encoding):
+        key = '\0'.join([os.path.realpath(path), str(stat.st_dev), str(stat.st_ino),
+                         str(stat.st_size), str(stat.st_mtime_ns), encoding, sys.byteorder])
+        return os.path.join(self.directory, hashlib.sha1(key.encode()).hexdigest() + '.idx')
+
+    def load(self, path, stat, encoding):
+        if stat.st_size < MIN_CACHED_FILE_SIZE:
+            return None
+        entry = self.entry_path(path, stat, encoding)
+        try:
+            with open(entry, 'rb') as f:
+                backing = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+
+        if len(backing) < HEADER.size:
+            backing.close()
+            return None
+        magic, size, count, longest = HEADER.unpack_from(backing)
+        if magic != MAGIC or size != stat.st_size or len(backing) != HEADER.size + count * 8:
+            backing.close()
+            return None
+
+        # Mark the entry as recently used for eviction
+        try:
+            os.utime(entry)
+        except OSError:
+            pass
+        return LineIndex.from_buffer(size, backing, HEADER.size, longest)
+
+    def save(self, path, stat, encoding, index):
+        if stat.st_size < MIN_CACHED_FILE_SIZE or not index.complete:
+            return
+        entry = self.entry_path(path, stat, encoding)
+        temp = f"{entry}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(temp, 'wb') as f:
+                f.write(HEADER.pack(MAGIC, index.size, len(index.starts), index.longest))
+                f.write(memoryview(index.starts).cast('B'))
+            os.replace(temp, entry)
+            self.evict()
+        except OSError:
+            # The cache is an optimisation only; a failed write just means a rescan next time
+            try:
+                os.remove(temp)
+            except OSError:
+                pass
+
+    def evict(self):
+        evict(self.directory, self.max_bytes, '.idx')
+
+
+def evict(directory, max_bytes, suffix):
+    """Delete the least recently used files ending in suffix until the rest fit in max_bytes."""
+    entries = []
+    for name in os.listdir(directory):
+        if not name.endswith(suffix):
+            continue
+        entry = os.path.join(directory, name)
+        try:
+            stat = os.stat(entry)
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, entry))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, entry in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(entry)
+            total -= size
+        except OSError:
+            pass
@@ -0,0 +1,86 @@
+import atexit
+import cProfile
+import functools
+import os
+import sys
+import threading
+import time
+
+# FTR_INSTRUMENT=1 times the hot paths; FTR_PROFILE=<file> writes cProfile stats of the main thread there
+ENABLED = os.environ.get('FTR_INSTRUMENT', '') not in ('', '0')
+PROFILE_PATH = os.environ.get('FTR_PROFILE') or None
+
+
+class Stats:
+    """Call counts and wall-clock totals per instrumented function."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # name -> [calls, total seconds, slowest call in seconds]
+        self.entries = {}
+
+    def record(self, name, elapsed):
+        with self.lock:
+            entry = self.entries.get(name)
+            if entry is None:
+                self.entries[name] = [1, elapsed, elapsed]
+            else:
+                entry[0] += 1
+                entry[1] += elapsed
+                entry[2] = max(entry[2], elapsed)
+
+    def snapshot(self):
+        """Return (name, calls, total, slowest) rows, most total time first."""
+        with self.lock:
+            rows = [(name, *entry) for name, entry in self.entries.items()]
+        return sorted(rows, key=lambda row: row[2], reverse=True)
+
+    def reset(self):
+        with self.lock:
+            self.entries.clear()
+
+    def report(self):
+        lines = [f"{'function':<40} {'calls':>8} {'total ms':>10} {'mean ms':>9} {'max ms':>9}"]
+        for name, calls, total, slowest in self.snapshot():
+            lines.append(f"{name:<40} {calls:>8,} {total * 1000:>10.1f} {total * 1000 / calls:>9.2f} "
+                         f"{slowest * 1000:>9.2f}")
+        return '\n'.join(lines)
+
+
+stats = Stats()
+
+
+def timed(fn):
+    """Record every call of fn in stats; returns fn itself when instrumentation is off."""
+    if not ENABLED:
+        return fn
+    name = fn.__qualname__
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            stats.record(name, time.perf_counter() - start)
+    return wrapper
+
+
+def profiled(fn, *args):
+    """Call fn(*args), under cProfile if FTR_PROFILE is set."""
+    if PROFILE_PATH is None:
+        return fn(*args)
+    profile = cProfile.Profile()
+    try:
+        return profile.runcall(fn, *args)
+    finally:
+        profile.dump_stats(PROFILE_PATH)
+
+
+def print_report():
+    if stats.entries:
+        print(stats.report(), file=sys.stderr)
+
+
+if ENABLED:
+    atexit.register(print_report)
@@ -0,0 +1,191 @@
+import operator
+import threading
+from array import array
+from bisect import bisect_right
+
+from instrumentation import timed
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+INDEX_CHUNK_SIZE = 16 * 1024 * 1024
+
+
+def buffer_window(buf, start, end):
+    """Return (data, base) where data supports the buffer protocol and covers buf[start:end].
+
+    Real buffers come back whole with base 0; anything else, such as a
+    CompressedBuffer, is sliced and base is the offset of the slice.
+    """
+    try:
+        memoryview(buf).release()
+        return buf, 0
+    except TypeError:
+        return buf[start:end], start
+
+
+def scan_newlines(buf, start, end, newline=b'\n', base=0):
+    """Return an array('Q') holding base plus the offset just past every newline in buf[start:end].
+
+    A two-byte newline is UTF-16 and only counts on even offsets from start.
+    """
+    buf, shift = buffer_window(buf, start, end)
+    start -= shift
+    end -= shift
+    base += shift
+    offsets = array('Q')
+    unit = len(newline)
+    if np is not None:
+        if unit == 1:
+            view = np.frombuffer(buf, dtype=np.uint8, count=end - start, offset=start)
+        else:
+            dtype = '<u2' if newline == b'\n\x00' else '>u2'
+            view = np.frombuffer(buf, dtype=dtype, count=(end - start) // 2, offset=start)
+        found = np.flatnonzero(view == 10).astype(np.uint64)
+        found *= unit
+        found += start + unit + base
+        offsets.frombytes(found.tobytes())
+        del view
+        return offsets
+
+    chunk = buf[start:end]
+    i = chunk.find(newline)
+    while i != -1:
+        if i % unit == 0:
+            offsets.append(base + start + i + unit)
+        i = chunk.find(newline, i + 1)
+    return offsets
+
+
+def longest_gap(previous, offsets):
+    """Return the largest step from previous through the ascending offsets, or 0 if there are none."""
+    if not offsets:
+        return 0
+    if np is not None:
+        values = np.frombuffer(offsets, dtype=np.uint64)
+        return max(int(values[0]) - previous, int(np.diff(values).max(initial=0)))
+    return max(offsets[0] - previous, max(map(operator.sub, offsets[1:], offsets), default=0))
+
+
+class LineIndex:
+    """Byte offsets of line starts, filled in front to back.
+
+    Lines are usable as soon as their end has been scanned, so a partly
+    built index can already serve the beginning of the file.
+    """
+
+    def __init__(self, size, first=0):
+        self.size = size
+        # The first line starts after any byte order mark
+        self.starts = array('Q', [first])
+        self.indexed_bytes = first
+        self.complete = size <= first
+        self.backing = None
+        # Length in bytes of the longest line indexed so far, newline included
+        self.longest = 0
+
+    @classmethod
+    def from_buffer(cls, size, backing, offset=0, longest=0):
+        """Wrap a finished index stored as native uint64 values in backing[offset:]."""
+        index = cls(size)
+        index.longest = longest
+        index.starts = memoryview(backing)[offset:].cast('Q')
+        index.backing = backing
+        index.indexed_bytes = size
+        index.complete = True
+        return index
+
+    def add_offsets(self, offsets, indexed_bytes):
+        self.longest = max(self.longest, longest_gap(self.starts[-1], offsets))
+        self.starts.extend(offsets)
+        self.indexed_bytes = indexed_bytes
+
+    def grow(self, size, ends_with_newline):
+        """Reopen a finished index so bytes appended up to size can be scanned."""
+        if self.backing is not None:
+            # A cached index is a read-only view; take an appendable copy
+            starts = array('Q')
+            with self.starts.cast('B') as raw:
+                starts.frombytes(raw)
+            self.close()
+            self.starts = starts
+        if ends_with_newline and self.starts[-1] != self.size:
+            self.starts.append(self.size)
+        self.size = size
+        self.complete = self.indexed_bytes == size
+
+    def finish(self):
+        # A trailing newline terminates the last line rather than starting a new one
+        if len(self.starts) > 1 and self.starts[-1] == self.size:
+            self.starts.pop()
+        self.longest = max(self.longest, self.size - self.starts[-1])
+        self.indexed_bytes = self.size
+        self.complete = True
+
+    @property
+    def line_count(self):
+        if self.complete:
+            return len(self.starts)
+        # The last known start belongs to a line whose end is not scanned yet
+        return len(self.starts) - 1
+
+    @property
+    def progress(self):
+        if self.size == 0:
+            return 1.0
+        return self.indexed_bytes / self.size
+
+    def covers(self, offset):
+        # Offsets inside the line still being scanned are not addressable yet
+        return self.complete or offset < self.starts[-1]
+
+    def line_start(self, line):
+        return self.starts[line]
+
+    def line_end(self, line):
+        if line + 1 < len(self.starts):
+            return self.starts[line + 1]
+        return self.size
+
+    def line_of_offset(self, offset):
+        return bisect_right(self.starts, offset) - 1
+
+    def close(self):
+        if self.backing is not None:
+            self.starts.release()
+            self.backing.close()
+            self.backing = None
+
+
+class LineIndexBuilder(threading.Thread):
+    """Scan a buffer for newlines in a worker thread, feeding a LineIndex."""
+
+    def __init__(self, buf, index, chunk_size=INDEX_CHUNK_SIZE, on_finish=None, newline=b'\n'):
+        super().__init__(daemon=True)
+        self.buf = buf
+        self.index = index
+        self.chunk_size = chunk_size
+        self.on_finish = on_finish
+        self.newline = newline
+        self.cancelled = threading.Event()
+
+    @timed
+    def run(self):
+        pos = self.index.indexed_bytes
+        size = self.index.size
+        while pos < size:
+            if self.cancelled.is_set():
+                return
+            end = min(pos + self.chunk_size, size)
+            self.index.add_offsets(scan_newlines(self.buf, pos, end, self.newline), end)
+            pos = end
+        self.index.finish()
+        if self.on_finish is not None:
+            self.on_finish()
+
+    def cancel(self):
+        self.cancelled.set()
+        if self.is_alive():
+            self.join()
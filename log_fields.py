@@ -0,0 +1,190 @@
+import os
+import re
+import threading
+from array import array
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# timestamp, level, component, message: "2024-05-02 08:32:31 INFO  cache retrying job 794772"
+DEFAULT_LINE_PATTERN = r'(?P<time>\S+[ T]\S+)\s+(?P<level>[A-Z]+)\s+(?P<component>\S+)\s+(?P<message>.*)'
+LINE_PATTERN = os.environ.get('FTR_LOG_PATTERN') or DEFAULT_LINE_PATTERN
+# Free text is left to the regex search; only fields with repeated values are worth a column
+TEXT_FIELDS = ('message',)
+EXTRACT_BATCH = 10000
+# Code of lines the pattern does not match, such as stack trace continuations
+MISSING = 0
+
+QUERY_TERM = re.compile(r'(\w+)\s*(!=|<=|>=|=|<|>|~)\s*(.*)')
+QUERY_AND = re.compile(r'\s+AND\s+', re.IGNORECASE)
+
+
+def parse_query(query, fields):
+    """Split 'level=ERROR AND component=db' into (field, operator, value) terms."""
+    terms = []
+    if not query.strip():
+        return terms
+    for term in QUERY_AND.split(query.strip()):
+        match = QUERY_TERM.fullmatch(term.strip())
+        if match is None:
+            raise ValueError(f"cannot parse {term!r}; expected field=value, !=, <, <=, >, >= or ~")
+        name, op, value = match.groups()
+        if name not in fields:
+            raise ValueError(f"unknown field {name!r}; fields are {', '.join(fields)}")
+        terms.append((name, op, value.strip().strip('"\'')))
+    return terms
+
+
+def value_test(op, target):
+    # Comma-separated targets are alternatives for =, != and ~
+    targets = target.split(',')
+    if op == '=':
+        return lambda value: value in targets
+    if op == '!=':
+        return lambda value: value not in targets
+    if op == '~':
+        return lambda value: any(t in value for t in targets)
+    # Plain string order, which is time order for ISO timestamps
+    return {'<': lambda value: value < target, '<=': lambda value: value <= target,
+            '>': lambda value: value > target, '>=': lambda value: value >= target}[op]
+
+
+class FieldTable:
+    """Fields of lines [0, parsed) of a document, parsed once and stored as columns.
+
+    Every field is dictionary-encoded: its column holds one code per line
+    into the field's list of distinct values. A filter finds the codes of
+    the values it wants and then selects lines with a vectorised lookup of
+    codes. = and != look their values up directly, and range operators
+    bisect a sorted copy of the values, so high-cardinality fields such as
+    timestamps never need a test per distinct value.
+    """
+
+    def __init__(self, pattern=LINE_PATTERN):
+        # Every line matches, with empty groups where the pattern does not, so findall keeps one row per line
+        self.regex = re.compile(f'^(?:{pattern})?.*$', re.MULTILINE)
+        self.fields = [name for name in self.regex.groupindex if name not in TEXT_FIELDS]
+        self.groups = [self.regex.groupindex[name] - 1 for name in self.fields]
+        self.columns = {name: array('I') for name in self.fields}
+        self.values = {name: [''] for name in self.fields}
+        self.codes = {name: {'': MISSING} for name in self.fields}
+        # Per field: (number of values sorted, values as sorted UTF-8, their codes), for range operators
+        self.sorted = {}
+        self.parsed = 0
+        self.lock = threading.Lock()
+
+    def extend(self, doc, end, cancelled=None):
+        """Parse lines [parsed, end) of doc; returns False if cancelled first."""
+        while self.parsed < end:
+            if cancelled is not None and cancelled.is_set():
+                return False
+            stop = min(end, self.parsed + EXTRACT_BATCH)
+            rows = self.regex.findall(doc.get_lines(self.parsed, stop))
+            if self.regex.groups == 1:
+                rows = [(row,) for row in rows]
+            with self.lock:
+                for name, group in zip(self.fields, self.groups):
+                    codes = self.codes[name]
+                    values = self.values[name]
+                    column = array('I')
+                    for row in rows:
+                        value = row[group]
+                        code = codes.get(value)
+                        if code is None:
+                            code = codes[value] = len(values)
+                            values.append(value)
+                        column.append(code)
+                    self.columns[name].extend(column)
+                self.parsed = stop
+        return True
+
+    def sorted_values(self, name):
+        """Return the field's values sorted as UTF-8 and their codes, sorting again only after new values."""
+        count, ordered, order = self.sorted.get(name, (0, None, None))
+        if count != len(self.values[name]):
+            # A copy, as extend may append to the list meanwhile
+            values = list(self.values[name])
+            # UTF-8 bytes sort in code point order, like the strings, at a quarter of the memory
+            encoded = np.array([value.encode() for value in values], dtype=bytes)
+            order = np.argsort(encoded)
+            ordered = encoded[order]
+            self.sorted[name] = len(values), ordered, order
+        return ordered, order
+
+    def lookup(self, name, op, target):
+        # A bool per code of the field, True where its value satisfies the term
+        values = self.values[name]
+        if op in ('=', '!='):
+            codes = self.codes[name]
+            hits = [codes[value] for value in target.split(',') if value in codes]
+            lookup = np.full(len(values), op == '!=', dtype=bool)
+            lookup[hits] = op == '='
+        elif op == '~':
+            test = value_test(op, target)
+            lookup = np.fromiter((test(value) for value in values), dtype=bool, count=len(values))
+        else:
+            ordered, order = self.sorted_values(name)
+            split = np.searchsorted(ordered, target.encode(), 'left' if op in ('<', '>=') else 'right')
+            lookup = np.zeros(len(values), dtype=bool)
+            lookup[order[:split] if op in ('<', '<=') else order[split:]] = True
+        lookup[MISSING] = False
+        return lookup
+
+    def filter(self, query):
+        """Return the numbers of the parsed lines matching every term of query, in order."""
+        terms = parse_query(query, self.fields)
+        with self.lock:
+            selected = None
+            for name, op, target in terms:
+                if np is not None:
+                    lookup = self.lookup(name, op, target)
+                    column = np.frombuffer(self.columns[name], dtype=np.uint32)
+                    hit = lookup[column]
+                    # Views keep the array's buffer exported, which would stop extend from growing it
+                    del column
+                    selected = hit if selected is None else selected & hit
+                else:
+                    test = value_test(op, target)
+                    wanted = {code for code, value in enumerate(self.values[name]) if code != MISSING and test(value)}
+                    column = self.columns[name]
+                    if selected is None:
+                        selected = [line for line, code in enumerate(column) if code in wanted]
+                    else:
+                        selected = [line for line in selected if column[line] in wanted]
+            if selected is None:
+                selected = range(self.parsed)
+
+        lines = array('Q')
+        if np is not None and isinstance(selected, np.ndarray):
+            lines.frombytes(np.flatnonzero(selected).astype(np.uint64).tobytes())
+        else:
+            lines.extend(selected)
+        return lines
+
+
+class FieldExtractor(threading.Thread):
+    """Parse the fields of every line a document has indexed so far in a worker thread."""
+
+    def __init__(self, doc, table, on_finish=None):
+        super().__init__(daemon=True)
+        self.doc = doc
+        self.table = table
+        self.on_finish = on_finish
+        self.cancelled = threading.Event()
+
+    def run(self):
+        if not self.table.extend(self.doc, self.doc.line_count, self.cancelled):
+            return
+        if np is not None:
+            # Sorted here rather than by the first range filter, which runs on the GUI thread
+            for name in self.table.fields:
+                self.table.sorted_values(name)
+        if self.on_finish is not None:
+            self.on_finish()
+
+    def cancel(self):
+        self.cancelled.set()
+        if self.is_alive():
+            self.join()
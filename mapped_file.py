@@ -0,0 +1,244 @@
+import mmap
+import os
+
+from compressed import CompressedBuffer, CompressedIndexBuilder, compression_format
+from decoding import DEFAULT_ERRORS, TextCodec
+from index_cache import IndexCache
+from instrumentation import timed
+from line_index import LineIndex, LineIndexBuilder
+from search_engine import (INCREMENTAL_CHUNK_SIZE, PARALLEL_MIN_SIZE, PARALLEL_WORKERS, SEARCH_CHUNK_SIZE,
+                           SearchWorker, collect, compile_pattern, scan_chunks, scan_shards)
+from trigram_index import (AVAILABLE as TRIGRAMS_AVAILABLE, MIN_TRIGRAM_FILE_SIZE, TrigramIndex,
+                           TrigramIndexBuilder, required_trigrams)
+
+UNCHANGED = 'unchanged'
+GROWN = 'grown'
+TRUNCATED = 'truncated'
+REPLACED = 'replaced'
+
+
+class MappedFile:
+    """Read-only memory-mapped view of a text file, addressed by line.
+
+    Compressed files are read through a CompressedBuffer instead of a
+    memory map; everything else works the same on top of it.
+    """
+
+    def __init__(self, path, encoding=None, errors=DEFAULT_ERRORS, index_cache=None, use_trigrams=False):
+        self.path = path
+        self.index_cache = index_cache if index_cache is not None else IndexCache()
+        self.file = open(path, 'rb')
+        self.stat = os.fstat(self.file.fileno())
+        self.compression = compression_format(path)
+        if self.compression is not None:
+            self.mm = CompressedBuffer(path, self.compression)
+        elif self.stat.st_size:
+            self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            # mmap refuses zero-length mappings
+            self.mm = b''
+        if encoding is None:
+            self.codec = TextCodec.detect(self.mm, errors)
+        else:
+            self.codec = TextCodec(encoding, errors=errors)
+
+        if self.compression is not None:
+            # Restart points live in memory only, so compressed files are always scanned
+            self.index = LineIndex(self.stat.st_size, self.codec.bom_length)
+        else:
+            self.index = (self.index_cache.load(path, self.stat, self.codec.encoding)
+                          or LineIndex(self.size, self.codec.bom_length))
+        self.builder = None
+
+        # Optional; only memory-mapped files are big and stable enough to be worth it
+        self.trigrams = None
+        self.trigram_builder = None
+        if (use_trigrams and TRIGRAMS_AVAILABLE and isinstance(self.mm, mmap.mmap)
+                and self.size >= MIN_TRIGRAM_FILE_SIZE):
+            self.trigrams = TrigramIndex(path, self.stat)
+
+    @property
+    def size(self):
+        # For a compressed file this is the part inflated so far
+        return len(self.mm)
+
+    @property
+    def encoding(self):
+        return self.codec.encoding
+
+    def save_index(self):
+        if self.compression is None:
+            self.index_cache.save(self.path, self.stat, self.codec.encoding, self.index)
+
+    def index_builder(self, on_finish=None):
+        if self.compression is not None:
+            return CompressedIndexBuilder(self.mm, self.index, on_finish=on_finish, newline=self.codec.newline)
+        return LineIndexBuilder(self.mm, self.index, on_finish=on_finish, newline=self.codec.newline)
+
+    def build_index(self):
+        if not self.index.complete:
+            self.index_builder(self.save_index).run()
+
+    def build_index_in_background(self):
+        if not self.index.complete:
+            self.builder = self.index_builder(self.save_index)
+            self.builder.start()
+        return self.builder
+
+    def build_trigram_index(self):
+        if self.trigrams is not None and self.trigrams.indexed < self.size:
+            TrigramIndexBuilder(self.mm, self.trigrams, self.stat).run()
+
+    def build_trigram_index_in_background(self):
+        """Bring the trigram index up to date from a worker thread, if this file has one."""
+        if (self.trigrams is not None and self.trigrams.indexed < self.size
+                and (self.trigram_builder is None or not self.trigram_builder.is_alive())):
+            self.trigram_builder = TrigramIndexBuilder(self.mm, self.trigrams, self.stat)
+            self.trigram_builder.start()
+        return self.trigram_builder
+
+    def refresh(self):
+        """Map and index bytes appended since the last look; returns what happened to the file."""
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            # During rotation the path can briefly be missing
+            return UNCHANGED
+        if self.compression is not None:
+            # A compressed file cannot be extended in place without rereading it
+            return UNCHANGED
+        if (stat.st_dev, stat.st_ino) != (self.stat.st_dev, self.stat.st_ino):
+            return REPLACED
+        if stat.st_size < self.size:
+            return TRUNCATED
+        if stat.st_size == self.size or not self.index.complete:
+            # Appends are only picked up once the index has reached the old end, and never if it was stopped
+            return UNCHANGED
+
+        newline = self.codec.newline
+        ends_with_newline = self.mm[self.size - len(newline):self.size] == newline
+        # Searches still running keep the old mapping alive until they finish
+        self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.stat = stat
+        self.index.grow(self.size, ends_with_newline)
+        self.index_builder().run()
+        self.build_trigram_index_in_background()
+        return GROWN
+
+    @property
+    def line_count(self):
+        return self.index.line_count
+
+    def line_start(self, line):
+        return self.index.line_start(line)
+
+    def line_end(self, line):
+        return self.index.line_end(line)
+
+    def line_of_offset(self, offset):
+        return self.index.line_of_offset(offset)
+
+    @timed
+    def get_lines(self, start, end):
+        """Decode lines [start, end) into a single string without the final newline."""
+        start = max(0, start)
+        end = min(end, self.line_count)
+        if start >= end:
+            return ''
+        first = self.line_start(start)
+        last = self.line_end(end - 1)
+        newline = self.codec.newline
+        if self.mm[last - len(newline):last] == newline:
+            last -= len(newline)
+        return self.codec.decode(self.mm, first, last)
+
+    def slice_bounds(self, line, offset, width):
+        """Return the byte range of line's text from offset to offset + width bytes in, on character starts."""
+        first = self.line_start(line)
+        last = self.line_end(line)
+        newline = self.codec.newline
+        if self.mm[last - len(newline):last] == newline:
+            last -= len(newline)
+        lo, hi = min(last, first + offset), min(last, first + offset + width)
+        # The line end is always a character start; anything before it may not be
+        if lo < last:
+            lo = max(first, self.codec.char_start(self.mm, lo))
+        if hi < last:
+            hi = max(lo, self.codec.char_start(self.mm, hi))
+        return lo, hi
+
+    @timed
+    def get_line_slices(self, start, end, offset, width):
+        """Like get_lines, but only each line's bytes [offset, offset + width) from its start are decoded."""
+        start = max(0, start)
+        end = min(end, self.line_count)
+        return '\n'.join(self.codec.decode(self.mm, *self.slice_bounds(line, offset, width))
+                         for line in range(start, end))
+
+    def column_in_slice(self, offset, slice_offset, width):
+        """Like column_of_offset, counting from the slice get_line_slices shows; clamped to that slice."""
+        line = self.line_of_offset(offset)
+        lo, hi = self.slice_bounds(line, slice_offset, width)
+        offset = min(max(offset, lo), hi)
+        if offset < hi:
+            offset = self.codec.char_start(self.mm, offset)
+        return line, len(self.codec.decode(self.mm, lo, offset))
+
+    def column_of_offset(self, offset):
+        line = self.line_of_offset(offset)
+        start = self.line_start(line)
+        offset = self.codec.char_start(self.mm, offset)
+        return line, len(self.codec.decode(self.mm, start, max(start, offset)))
+
+    def offset_of_column(self, line, column):
+        start = self.line_start(line)
+        text = self.codec.decode(self.mm, start, self.line_end(line))
+        return start + len(self.codec.encode(text[:column]))
+
+    def compile(self, pattern, **options):
+        # options are compile_pattern's: literal, ignore_case and whole_word
+        return compile_pattern(pattern, self.encoding, **options)
+
+    def scan(self, regex, chunk_size=SEARCH_CHUNK_SIZE, cancelled=None):
+        unit = self.codec.unit
+        if self.trigrams is not None and self.trigrams.rows is not None:
+            trigrams = required_trigrams(regex)
+            if trigrams:
+                return self.trigrams.scan(self.mm, regex, trigrams, chunk_size, unit, cancelled)
+        if isinstance(self.mm, mmap.mmap) and self.size >= PARALLEL_MIN_SIZE and PARALLEL_WORKERS > 1:
+            return scan_shards(self.path, self.mm, regex, unit=unit, cancelled=cancelled)
+        return scan_chunks(self.mm, regex, chunk_size=chunk_size, unit=unit, cancelled=cancelled)
+
+    @timed
+    def search(self, pattern, **options):
+        """Return a MatchList of every match of the regex pattern in the file."""
+        return collect(self.scan(self.compile(pattern, **options)))
+
+    def search_in_background(self, pattern, matches=None, **options):
+        """Start filling a MatchList from a worker thread; returns the SearchWorker.
+
+        Passing the MatchList of a finished search of the same pattern
+        continues it over bytes appended since, starting again from the
+        old last line, which may have been extended.
+        """
+        regex = self.compile(pattern, **options)
+        if matches is None:
+            worker = SearchWorker(self.scan, regex, INCREMENTAL_CHUNK_SIZE)
+        else:
+            matches.drop_from(self.line_start(self.line_of_offset(matches.scanned_to)))
+            worker = SearchWorker(scan_chunks, self.mm, regex, matches.scanned_to, None,
+                                  INCREMENTAL_CHUNK_SIZE, self.codec.unit, matches=matches)
+        worker.start()
+        return worker
+
+    def close(self):
+        if self.builder is not None:
+            self.builder.cancel()
+        if self.trigram_builder is not None:
+            self.trigram_builder.cancel()
+        if self.trigrams is not None:
+            self.trigrams.close()
+        self.index.close()
+        if isinstance(self.mm, mmap.mmap):
+            self.mm.close()
+        self.file.close()
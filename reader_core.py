@@ -0,0 +1,381 @@
+import argparse
+import mmap
+import os
+import re
+import sys
+import threading
+from collections import OrderedDict
+from itertools import count
+
+from export import Export, line_span, matching_line_spans
+from instrumentation import profiled
+from log_fields import FieldTable
+from mapped_file import GROWN, MappedFile
+
+# Returned by Document.next_match and previous_match while the answer depends on bytes not scanned yet
+PENDING = 'pending'
+# Lines decoded per step when streaming a line range
+LINE_BATCH = 10000
+# Lines per page of decoded text in the shared page cache
+PAGE_LINES = 1000
+PAGE_CACHE_BYTES = int(os.environ.get('FTR_PAGE_CACHE_MB', '64')) * 1024 * 1024
+
+
+class PageCache:
+    """Process-wide LRU of decoded line pages, bounded by their size in memory.
+
+    Keys are (document id, page number); every open Document shares the
+    same budget, so the total stays bounded however many files are open.
+    """
+
+    def __init__(self, max_bytes=PAGE_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.used = 0
+        self.pages = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            text = self.pages.get(key)
+            if text is not None:
+                self.pages.move_to_end(key)
+            return text
+
+    def put(self, key, text):
+        size = sys.getsizeof(text)
+        with self.lock:
+            old = self.pages.pop(key, None)
+            if old is not None:
+                self.used -= sys.getsizeof(old)
+            self.pages[key] = text
+            self.used += size
+            while self.used > self.max_bytes and self.pages:
+                _, evicted = self.pages.popitem(last=False)
+                self.used -= sys.getsizeof(evicted)
+
+    def discard(self, doc_id, first_page=0):
+        """Drop the pages of one document from first_page on."""
+        with self.lock:
+            for key in [key for key in self.pages if key[0] == doc_id and key[1] >= first_page]:
+                self.used -= sys.getsizeof(self.pages.pop(key))
+
+
+page_cache = PageCache()
+_document_ids = count()
+
+
+class Document(MappedFile):
+    """A file opened for reading, with no GUI attached.
+
+    This is the whole reader engine (memory map, line index, decoding and
+    search) behind one object, for the Tk viewer and for batch use alike.
+    Nothing here imports tkinter.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.id = next(_document_ids)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def description(self):
+        if self.compression is None:
+            return self.encoding
+        return f"{self.compression}, {self.encoding}"
+
+    def page(self, number):
+        """Return the text of lines [number * PAGE_LINES, (number + 1) * PAGE_LINES) through the page cache."""
+        key = (self.id, number)
+        text = page_cache.get(key)
+        if text is None:
+            first = number * PAGE_LINES
+            text = self.get_lines(first, first + PAGE_LINES)
+            # A page the index has not reached the end of yet would be cached short
+            if self.index.complete or first + PAGE_LINES <= self.line_count:
+                page_cache.put(key, text)
+        return text
+
+    def cached_lines(self, start, end):
+        """Like get_lines, reusing decoded pages shared by all open documents."""
+        start = max(0, start)
+        end = min(end, self.line_count)
+        if start >= end:
+            return ''
+        lines = []
+        for number in range(start // PAGE_LINES, (end - 1) // PAGE_LINES + 1):
+            first = number * PAGE_LINES
+            lines.extend(self.page(number).split('\n')[max(0, start - first):end - first])
+        return '\n'.join(lines)
+
+    def refresh(self):
+        old_count = self.line_count
+        change = super().refresh()
+        if change == GROWN:
+            # The old last line may have been extended; later pages did not exist
+            page_cache.discard(self.id, max(0, old_count - 1) // PAGE_LINES)
+        return change
+
+    def close(self):
+        page_cache.discard(self.id)
+        super().close()
+
+    def iter_lines(self, start=0, end=None):
+        """Yield the text of lines [start, end) one by one, decoding LINE_BATCH lines at a time."""
+        end = self.line_count if end is None else min(end, self.line_count)
+        for first in range(max(0, start), end, LINE_BATCH):
+            yield from self.get_lines(first, min(end, first + LINE_BATCH)).split('\n')
+
+    def iter_matches(self, pattern, **options):
+        """Yield the (start, end) byte span of each match of pattern, in file order, as it is found."""
+        for _, starts, ends in self.scan(self.compile(pattern, **options)):
+            yield from zip(starts, ends)
+
+    def line_bounds(self, offset):
+        """Return the byte range of the line holding offset, without its newline."""
+        newline = self.codec.newline
+        if self.index.covers(offset):
+            line = self.line_of_offset(offset)
+            start, end = self.line_start(line), self.line_end(line)
+        else:
+            # Past the index, single-byte newlines can be found directly in the buffer
+            start = max(self.codec.bom_length, self.mm.rfind(newline, 0, offset) + 1)
+            end = self.mm.find(newline, offset)
+            end = self.size if end == -1 else end + 1
+        if self.mm[end - len(newline):end] == newline:
+            end -= len(newline)
+        return start, end
+
+    def grep(self, pattern, **options):
+        """Yield (line, text) once for every line holding a match of pattern.
+
+        line is the zero-based line number, or None where the index does
+        not reach yet.
+        """
+        last_end = -1
+        for start, _ in self.iter_matches(pattern, **options):
+            if start <= last_end:
+                continue
+            line_start, last_end = self.line_bounds(start)
+            line = self.line_of_offset(start) if self.index.covers(start) else None
+            yield line, self.codec.decode(self.mm, line_start, last_end)
+
+    def resolve_position(self, position):
+        """Return the byte offset named by position: '1200' (line), '@4096' or '@0x1000' (byte offset) or '50%'.
+
+        Lines are counted from 1 and percentages are of the file's bytes. The
+        position must lie in the part of the file indexed so far.
+        """
+        text = position.strip().replace(',', '').replace('_', '')
+        try:
+            if text.endswith('%'):
+                offset = int(float(text[:-1]) / 100 * self.size)
+                line = None
+            elif text.startswith('@'):
+                offset = int(text[1:], 0)
+                line = None
+            else:
+                line = int(text) - 1
+        except ValueError:
+            raise ValueError(f"not a line number, @offset or percentage: {position!r}") from None
+
+        if line is not None:
+            if not 0 <= line < self.line_count:
+                if self.index.complete:
+                    raise ValueError(f"line {line + 1:,} is not in the file, which has {self.line_count:,} lines")
+                raise ValueError(f"line {line + 1:,} is past the {self.line_count:,} lines indexed so far")
+            return self.line_start(line)
+        if not 0 <= offset <= self.size:
+            raise ValueError(f"offset {offset:,} is not in the file, which has {self.size:,} bytes")
+        offset = max(self.codec.bom_length, min(offset, self.size - 1))
+        if not self.index.covers(offset):
+            raise ValueError(f"offset {offset:,} is past the part of the file indexed so far")
+        return self.codec.char_start(self.mm, offset)
+
+    def next_match(self, matches, offset=None):
+        """Return the first span in matches starting after offset (None: from the top), or None.
+
+        matches may still be filling from a SearchWorker, which adds them in
+        file order; PENDING means the answer is not known yet.
+        """
+        span = matches.next_after(-1 if offset is None else offset)
+        if span is None and not matches.complete:
+            return PENDING
+        return span
+
+    def previous_match(self, matches, offset=None):
+        """Return the last span in matches starting before offset (None: from the bottom), or None."""
+        end = self.size + 1 if offset is None else offset
+        if not self.index.complete:
+            # Only look back from the end of the part indexed so far
+            end = min(end, self.line_start(self.line_count))
+        if matches.scanned_to < end and not matches.complete:
+            return PENDING
+        return matches.previous_before(end)
+
+
+def run_info(args):
+    for path in args.files:
+        with Document(path, encoding=args.encoding) as doc:
+            doc.build_index()
+            print(f"{path}: {doc.description}, {doc.size:,} bytes, {doc.line_count:,} lines")
+    return 0
+
+
+def run_grep(args):
+    found = False
+    for path in args.files:
+        with Document(path, encoding=args.encoding, use_trigrams=args.trigram_index) as doc:
+            doc.build_trigram_index()
+            # Line bounds are found without the index only for plain single-byte-newline files
+            if args.line_number or doc.codec.unit != 1 or not isinstance(doc.mm, mmap.mmap):
+                doc.build_index()
+            prefix = f"{path}:" if len(args.files) > 1 else ''
+            count = 0
+            for line, text in doc.grep(args.pattern, literal=args.fixed_strings, ignore_case=args.ignore_case,
+                                       whole_word=args.word_regexp):
+                count += 1
+                if not args.count:
+                    number = f"{line + 1}:" if args.line_number else ''
+                    sys.stdout.write(f"{prefix}{number}{text}\n")
+                if count == args.max_count:
+                    break
+            if args.count:
+                sys.stdout.write(f"{prefix}{count}\n")
+            found = found or count > 0
+    return 0 if found else 1
+
+
+def run_filter(args):
+    found = False
+    for path in args.files:
+        with Document(path, encoding=args.encoding) as doc:
+            doc.build_index()
+            table = FieldTable()
+            table.extend(doc, doc.line_count)
+            lines = table.filter(args.query)
+            prefix = f"{path}:" if len(args.files) > 1 else ''
+            if args.count:
+                sys.stdout.write(f"{prefix}{len(lines)}\n")
+            else:
+                for line in lines:
+                    number = f"{line + 1}:" if args.line_number else ''
+                    sys.stdout.write(f"{prefix}{number}{doc.get_lines(line, line + 1)}\n")
+            found = found or len(lines) > 0
+    return 0 if found else 1
+
+
+def parse_range(text):
+    first, _, last = text.partition('-')
+    return int(first), int(last or first)
+
+
+def run_export(args):
+    with Document(args.file, encoding=args.encoding) as doc:
+        doc.build_index()
+        if args.lines is not None:
+            first, last = parse_range(args.lines)
+            if not 1 <= first <= last <= doc.line_count:
+                raise ValueError(f"lines {args.lines} are not in the file, which has {doc.line_count:,} lines")
+            spans = [line_span(doc, first - 1, last)]
+            extent = spans[0]
+        elif args.bytes is not None:
+            start, end = parse_range(args.bytes)
+            if not 0 <= start <= end <= doc.size:
+                raise ValueError(f"bytes {args.bytes} are not in the file, which has {doc.size:,} bytes")
+            spans = [(start, end)]
+            extent = spans[0]
+        else:
+            matches = doc.search(args.matching, literal=args.fixed_strings, ignore_case=args.ignore_case,
+                                 whole_word=args.word_regexp)
+            spans = matching_line_spans(doc, matches)
+            extent = None
+        export = Export(doc, spans, args.output, extent)
+        export.run()
+        if export.error is not None:
+            raise export.error
+    return 0
+
+
+def run_lines(args):
+    with Document(args.file, encoding=args.encoding) as doc:
+        doc.build_index()
+        last = args.first if args.last is None else args.last
+        for text in doc.iter_lines(args.first - 1, last):
+            sys.stdout.write(text + '\n')
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m reader_core',
+                                     description="Read, search and slice large text files without a GUI")
+    parser.add_argument('--encoding', help="file encoding; detected from the file if omitted")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    info = subparsers.add_parser('info', help="show encoding, size and line count")
+    info.add_argument('files', nargs='+')
+    info.set_defaults(run=run_info)
+
+    grep = subparsers.add_parser('grep', help="print lines matching a regular expression")
+    grep.add_argument('-n', '--line-number', action='store_true', help="prefix lines with their number")
+    grep.add_argument('-c', '--count', action='store_true', help="print only the number of matching lines")
+    grep.add_argument('-m', '--max-count', type=int, default=0, help="stop after this many matching lines")
+    grep.add_argument('-F', '--fixed-strings', action='store_true', help="treat the pattern as literal text")
+    grep.add_argument('-i', '--ignore-case', action='store_true', help="ignore the case of ASCII letters")
+    grep.add_argument('-w', '--word-regexp', action='store_true', help="match only whole words")
+    grep.add_argument('--trigram-index', action='store_true',
+                      help="narrow the search with a trigram index of large files, built on first use")
+    grep.add_argument('pattern')
+    grep.add_argument('files', nargs='+')
+    grep.set_defaults(run=run_grep)
+
+    filter_ = subparsers.add_parser('filter', help="print log lines whose fields match a query",
+                                    description="Query terms look like level=ERROR, component~db or "
+                                                "time>=2024-05-02, joined with AND.")
+    filter_.add_argument('-n', '--line-number', action='store_true', help="prefix lines with their number")
+    filter_.add_argument('-c', '--count', action='store_true', help="print only the number of matching lines")
+    filter_.add_argument('query')
+    filter_.add_argument('files', nargs='+')
+    filter_.set_defaults(run=run_filter)
+
+    export = subparsers.add_parser('export', help="copy lines, bytes or matching lines to a file as stored")
+    what = export.add_mutually_exclusive_group(required=True)
+    what.add_argument('--lines', metavar='FIRST[-LAST]', help="1-based, inclusive")
+    what.add_argument('--bytes', metavar='START-END', help="byte offsets, end exclusive")
+    what.add_argument('--matching', metavar='PATTERN', help="every line holding a match of PATTERN")
+    export.add_argument('-F', '--fixed-strings', action='store_true', help="treat the pattern as literal text")
+    export.add_argument('-i', '--ignore-case', action='store_true', help="ignore the case of ASCII letters")
+    export.add_argument('-w', '--word-regexp', action='store_true', help="match only whole words")
+    export.add_argument('file')
+    export.add_argument('output')
+    export.set_defaults(run=run_export)
+
+    lines = subparsers.add_parser('lines', help="print a range of lines (1-based, inclusive)")
+    lines.add_argument('file')
+    lines.add_argument('first', type=int)
+    lines.add_argument('last', type=int, nargs='?')
+    lines.set_defaults(run=run_lines)
+
+    args = parser.parse_args(argv)
+    sys.stdout.reconfigure(errors='replace')
+    try:
+        return args.run(args)
+    except re.error as e:
+        print(f"invalid pattern: {e}", file=sys.stderr)
+        return 2
+    except BrokenPipeError:
+        # The reader went away (e.g. piped into head); stop quietly
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        return 1
+    except (OSError, ValueError) as e:
+        print(e, file=sys.stderr)
+        return 2
+
+
+if __name__ == "__main__":
+    sys.exit(profiled(main))
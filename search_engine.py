@@ -0,0 +1,393 @@
+import codecs
+import mmap
+import multiprocessing
+import os
+import re
+import string
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ProcessPoolExecutor, wait
+from itertools import chain
+
+from instrumentation import timed
+from line_index import buffer_window
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+SEARCH_CHUNK_SIZE = 8 * 1024 * 1024
+# Background scans hold the GIL for one chunk at a time, so keep those small
+INCREMENTAL_CHUNK_SIZE = 1024 * 1024
+# Files below this size are searched in-process; pool dispatch would cost more than it saves
+PARALLEL_MIN_SIZE = 64 * 1024 * 1024
+PARALLEL_WORKERS = os.cpu_count() or 1
+SHARDS_PER_WORKER = 4
+MAX_SHARD_SIZE = 64 * 1024 * 1024
+RESULT_POLL_SECONDS = 0.05
+# How far past a chunk boundary a match that started inside the chunk may extend
+CHUNK_OVERLAP = 64 * 1024
+
+_executor = None
+
+
+# Whole-word search treats every byte of a non-ASCII UTF-8 character as part of a word
+WORD_CLASS = rb'[\w\x80-\xff]'
+REGEX_SYNTAX = set('.^$*+?{}[]\\|()')
+# A literal hit at least once per DENSE_GAP bytes over DENSE_HITS hits is left to the regex engine's loop
+DENSE_HITS = 256
+DENSE_GAP = 1024
+ASCII_LOWER = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+
+class LiteralMatch:
+    __slots__ = ('span_start', 'span_end')
+
+    def __init__(self, start, end):
+        self.span_start = start
+        self.span_end = end
+
+    def start(self):
+        return self.span_start
+
+    def end(self):
+        return self.span_end
+
+
+class LiteralPattern:
+    """Stand-in for a compiled regex that finds one fixed string of bytes.
+
+    Hits are found with find, whose substring search beats the regex
+    engine's on most literals, until they prove dense enough that a
+    Python call per hit costs more; the rest of the window then goes to
+    the regex engine. Case-insensitive search lowercases the window once
+    and searches it case-sensitively, and whole-word search checks the
+    code units around each hit; both are several times faster than the
+    regex engine doing the same with IGNORECASE or lookarounds. As with
+    bytes patterns, only ASCII letters fold.
+    """
+
+    def __init__(self, literal, ignore_case=False, whole_word=False, unit=1, byteorder='little'):
+        self.ignore_case = ignore_case
+        self.whole_word = whole_word
+        self.unit = unit
+        self.byteorder = byteorder
+        self.literal = literal.lower() if ignore_case else literal
+        self.regex = re.compile(re.escape(self.literal))
+        if unit == 2 and ignore_case:
+            # Lowercasing bytes also changes the halves of non-ASCII UTF-16 units, so hits are checked unit by unit
+            self.encoding = 'utf-16-be' if byteorder == 'big' else 'utf-16-le'
+            self.folded = self.fold(literal)
+        # What required_trigrams and error messages read from a compiled pattern
+        self.pattern = re.escape(literal)
+        self.flags = re.IGNORECASE if ignore_case else 0
+
+    def fold(self, data):
+        return data.decode(self.encoding, 'surrogatepass').translate(ASCII_LOWER)
+
+    def is_word(self, data, start, end):
+        if start < 0 or end > len(data):
+            return False
+        code = int.from_bytes(data[start:end], self.byteorder)
+        return code == 0x5F or chr(code).isalnum() or (self.unit == 1 and code >= 0x80)
+
+    def matches(self, data, pos, endpos):
+        literal = self.literal
+        length = len(literal)
+        found = []
+        first = pos
+        while length:
+            start = data.find(literal, pos, endpos)
+            if start == -1:
+                return iter(found)
+            pos = start + length
+            found.append(LiteralMatch(start, pos))
+            if len(found) % DENSE_HITS == 0 and pos - first < len(found) * DENSE_GAP:
+                break
+        return chain(found, self.regex.finditer(data, pos, endpos))
+
+    def finditer(self, data, pos=0, endpos=None):
+        endpos = len(data) if endpos is None else endpos
+        if not (self.ignore_case or self.whole_word):
+            return self.matches(data, pos, endpos)
+        return self.filtered(data, pos, endpos)
+
+    def filtered(self, data, pos, endpos):
+        if self.ignore_case:
+            base = pos
+            matches = self.matches(bytes(data[pos:endpos]).lower(), 0, endpos - pos)
+        else:
+            base = 0
+            matches = self.matches(data, pos, endpos)
+        unit = self.unit
+        check_case = unit == 2 and self.ignore_case
+        for match in matches:
+            start, end = match.start() + base, match.end() + base
+            if check_case and self.fold(data[start:end]) != self.folded:
+                continue
+            if self.whole_word and (self.is_word(data, start - unit, start) or self.is_word(data, end, end + unit)):
+                continue
+            yield LiteralMatch(start, end)
+
+
+def compile_pattern(pattern, encoding='utf-8', literal=False, ignore_case=False, whole_word=False):
+    """Compile a search for pattern in text of encoding: a regex, or a LiteralPattern where that is faster."""
+    try:
+        encoded = pattern.encode(encoding)
+    except UnicodeEncodeError:
+        raise re.error(f"pattern cannot be encoded as {encoding}")
+    name = codecs.lookup(encoding).name
+    if name.startswith('utf-16'):
+        # Regex syntax does not survive encoding to UTF-16, so only literal text can be searched for
+        if not literal and REGEX_SYNTAX & set(pattern):
+            raise re.error(f"regular expressions are not supported in {name} text; search for it literally")
+        return LiteralPattern(encoded, ignore_case, whole_word, 2, 'big' if name.endswith('be') else 'little')
+    if literal or not REGEX_SYNTAX & set(pattern):
+        return LiteralPattern(encoded, ignore_case, whole_word)
+    if whole_word:
+        encoded = b'(?<!' + WORD_CLASS + b')(?:' + encoded + b')(?!' + WORD_CLASS + b')'
+    return re.compile(encoded, re.MULTILINE | (re.IGNORECASE if ignore_case else 0))
+
+
+def line_boundary(buf, pos, size, reach=None, unit=1):
+    """Return the offset just past the first newline at or after pos, or size.
+
+    With a reach, a line running on more than reach bytes past pos is cut
+    at pos instead, rounded up to a whole code unit.
+    """
+    if pos >= size:
+        return size
+    newline = buf.find(b'\n', pos, size if reach is None else min(size, pos + reach))
+    if newline != -1:
+        return newline + 1
+    if reach is None or pos + reach >= size:
+        return size
+    return pos + -pos % unit
+
+
+def scan_chunks(buf, regex, start=0, end=None, chunk_size=SEARCH_CHUNK_SIZE, unit=1, cancelled=None):
+    """Scan buf[start:end] chunk by chunk, yielding (scanned_up_to, starts, ends).
+
+    Chunks end on line boundaries. Each chunk is matched with a bounded
+    look-ahead so matches that cross into the next chunk are still found
+    once, and the next chunk resumes after the last match. A line much
+    longer than chunk_size is cut at a code unit boundary instead, so no
+    step scans more than about chunk_size bytes. Matches may
+    extend past end but never start there. With a unit of 2 (UTF-16),
+    matches at odd offsets straddle characters and are dropped. Without
+    an end, a compressed buffer that is still inflating is scanned to the
+    end of its data rather than of the part inflated so far.
+    """
+    size = len(buf)
+    if end is None and not getattr(buf, 'complete', True):
+        # A compressed file still inflating reads on past its current length; the data shows where it ends
+        size = 2 ** 63
+    stop = size if end is None else end
+    pos = start
+    while pos < stop:
+        if cancelled is not None and cancelled.is_set():
+            return
+        # A chunk only runs on to a newline close by, so a huge single line is still scanned in bounded steps
+        boundary = min(stop, line_boundary(buf, pos + chunk_size, size, CHUNK_OVERLAP, unit))
+        # Stop the look-ahead on a newline so '$' cannot match at an artificial end
+        limit = min(size, boundary + CHUNK_OVERLAP)
+        if limit < size:
+            newline = buf.find(b'\n', limit, min(size, limit + CHUNK_OVERLAP))
+            if newline != -1:
+                limit = newline
+
+        starts = array('Q')
+        ends = array('Q')
+        data, base = buffer_window(buf, pos, limit)
+        if base + len(data) < limit:
+            size = stop = limit = base + len(data)
+            boundary = min(boundary, size)
+        resume = boundary
+        for match in regex.finditer(data, pos - base, limit - base):
+            match_start = match.start() + base
+            if match_start >= boundary:
+                break
+            if match_start % unit:
+                continue
+            starts.append(match_start)
+            ends.append(match.end() + base)
+            resume = max(resume, match.end() + base)
+        yield resume, starts, ends
+        pos = resume
+
+
+class MatchList:
+    """Sorted byte spans of every match of a query, for bisect navigation."""
+
+    def __init__(self):
+        self.starts = array('Q')
+        self.ends = array('Q')
+        self.scanned_to = 0
+        self.complete = False
+
+    def __len__(self):
+        return len(self.starts)
+
+    def add(self, starts, ends, scanned_to):
+        # Ends go first so readers bisecting starts from another thread always find a matching end
+        self.ends.extend(ends)
+        self.starts.extend(starts)
+        self.scanned_to = scanned_to
+
+    def span(self, i):
+        return self.starts[i], self.ends[i]
+
+    def drop_from(self, offset):
+        """Forget the matches starting at or after offset, so a scan can resume there."""
+        i = bisect_left(self.starts, offset)
+        # Starts go first so readers bisecting starts from another thread always find a matching end
+        del self.starts[i:]
+        del self.ends[i:]
+        # As scan_chunks does, carry on past a match that ran over offset
+        self.scanned_to = max(offset, self.ends[i - 1]) if i else offset
+
+    def next_after(self, offset):
+        """Return the first match starting after offset, or None."""
+        i = bisect_right(self.starts, offset)
+        if i < len(self.starts):
+            return self.span(i)
+        return None
+
+    def previous_before(self, offset):
+        """Return the last match starting before offset, or None."""
+        i = bisect_left(self.starts, offset)
+        if i > 0:
+            return self.span(i - 1)
+        return None
+
+    def between(self, lo, hi):
+        """Yield the matches starting in [lo, hi)."""
+        i = bisect_left(self.starts, lo)
+        while i < len(self.starts) and self.starts[i] < hi:
+            yield self.span(i)
+            i += 1
+
+    def rank(self, offset):
+        """Return the 1-based position of the match starting at offset."""
+        return bisect_left(self.starts, offset) + 1
+
+
+def hit_histogram(starts, size, buckets):
+    """Count match starts in each of buckets equal byte ranges of [0, size)."""
+    if size <= 0 or buckets <= 0:
+        return []
+    # Copy first; a live buffer export would stop a SearchWorker from growing the array
+    snapshot = starts[:len(starts)]
+    if np is not None:
+        offsets = np.frombuffer(snapshot, dtype=np.uint64)
+        bins = np.minimum(offsets * buckets // size, buckets - 1).astype(np.intp)
+        return np.bincount(bins, minlength=buckets).tolist()
+
+    counts = [0] * buckets
+    for offset in snapshot:
+        counts[min(offset * buckets // size, buckets - 1)] += 1
+    return counts
+
+
+def collect(chunks):
+    matches = MatchList()
+    for scanned_to, starts, ends in chunks:
+        matches.add(starts, ends, scanned_to)
+    matches.complete = True
+    return matches
+
+
+def find_all(buf, regex, start=0, end=None, chunk_size=SEARCH_CHUNK_SIZE, unit=1):
+    return collect(scan_chunks(buf, regex, start, end, chunk_size, unit))
+
+
+def search_shard(path, regex, start, end, unit=1):
+    # Each worker maps the file itself so no file bytes cross the process boundary
+    with open(path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return find_all(mm, regex, start, end, unit=unit)
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        # spawn keeps workers clear of the GUI's threads and Tk state
+        _executor = ProcessPoolExecutor(max_workers=PARALLEL_WORKERS,
+                                        mp_context=multiprocessing.get_context('spawn'))
+    return _executor
+
+
+def shard_bounds(buf, start, end, count):
+    bounds = [start]
+    step = max(1, (end - start) // count)
+    while bounds[-1] < end:
+        bounds.append(min(end, line_boundary(buf, bounds[-1] + step, len(buf))))
+    return list(zip(bounds, bounds[1:]))
+
+
+def scan_shards(path, buf, regex, start=0, end=None, executor=None, workers=PARALLEL_WORKERS,
+                unit=1, cancelled=None):
+    """Like scan_chunks, but scans line-aligned shards of the file in a process pool.
+
+    buf is the caller's own mapping of path, used only to place shard
+    boundaries on line starts. Shards are yielded in file order.
+    """
+    if end is None:
+        end = len(buf)
+    if executor is None:
+        executor = get_executor()
+    # Bounded shards keep results flowing early on very large files
+    count = max(workers * SHARDS_PER_WORKER, -(-(end - start) // MAX_SHARD_SIZE))
+    futures = [executor.submit(search_shard, path, regex, lo, hi, unit)
+               for lo, hi in shard_bounds(buf, start, end, count)]
+
+    scanned_to = start
+    try:
+        for future in futures:
+            while not wait([future], timeout=RESULT_POLL_SECONDS).done:
+                if cancelled is not None and cancelled.is_set():
+                    return
+            part = future.result()
+            # Drop matches overlapping one that ran on from the previous shard
+            skip = bisect_left(part.starts, scanned_to)
+            scanned_to = max(scanned_to, part.scanned_to)
+            yield scanned_to, part.starts[skip:], part.ends[skip:]
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+def find_all_parallel(path, buf, regex, start=0, end=None, executor=None, workers=PARALLEL_WORKERS, unit=1):
+    return collect(scan_shards(path, buf, regex, start, end, executor, workers, unit))
+
+
+class SearchWorker(threading.Thread):
+    """Collect matches into a MatchList from a worker thread as they are found.
+
+    scan is called as scan(*args, cancelled=event) and must return an
+    iterator like scan_chunks.
+    """
+
+    def __init__(self, scan, *args, matches=None):
+        super().__init__(daemon=True)
+        self.scan = scan
+        self.args = args
+        self.matches = MatchList() if matches is None else matches
+        self.matches.complete = False
+        self.cancelled = threading.Event()
+
+    @timed
+    def run(self):
+        for scanned_to, starts, ends in self.scan(*self.args, cancelled=self.cancelled):
+            if self.cancelled.is_set():
+                return
+            self.matches.add(starts, ends, scanned_to)
+        if not self.cancelled.is_set():
+            self.matches.complete = True
+
+    def cancel(self):
+        self.cancelled.set()
+        if self.is_alive():
+            self.join()
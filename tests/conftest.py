@@ -0,0 +1,28 @@
+import os
+import sys
+
+import pytest
+
+# The reader's modules live flat at the top of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from index_cache import IndexCache  # noqa: E402
+from reader_core import Document  # noqa: E402
+
+
+@pytest.fixture
+def open_document(tmp_path):
+    """Write data to a file and open it as a Document whose index cache lives in tmp_path."""
+    documents = []
+
+    def open_document(data, name='sample.log', **kwargs):
+        path = tmp_path / name
+        path.write_bytes(data)
+        kwargs.setdefault('index_cache', IndexCache(str(tmp_path / 'cache')))
+        doc = Document(str(path), **kwargs)
+        documents.append(doc)
+        return doc
+
+    yield open_document
+    for doc in documents:
+        doc.close()
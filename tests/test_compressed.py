@@ -0,0 +1,110 @@
+import bz2
+import gzip
+import lzma
+import random
+import re
+
+import pytest
+
+import compressed
+from compressed import CompressedBuffer, compression_format
+from search_engine import find_all
+
+DATA = b''.join(b'%06d %s\n' % (i, b'needle' if i % 97 == 0 else b'hay' * (i % 13)) for i in range(20000))
+
+
+def write(tmp_path, name, data):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+
+def halves(compress):
+    # Two streams back to back, as pigz, pbzip2 and friends write them
+    middle = len(DATA) // 2
+    return compress(DATA[:middle]) + compress(DATA[middle:])
+
+
+FORMATS = {
+    'gzip': lambda: gzip.compress(DATA),
+    'gzip-multistream': lambda: halves(gzip.compress),
+    'bz2': lambda: bz2.compress(DATA),
+    'bz2-multistream': lambda: halves(bz2.compress),
+    'xz': lambda: lzma.compress(DATA),
+}
+
+
+@pytest.fixture(params=sorted(FORMATS))
+def buffer(request, tmp_path, monkeypatch):
+    # Closer restart points than usual, so reads really pick one
+    monkeypatch.setattr(compressed, 'CHECKPOINT_SPACING', 16 * 1024)
+    path = write(tmp_path, 'data.log.' + request.param, FORMATS[request.param]())
+    buf = CompressedBuffer(path, compression_format(path))
+    assert buf.build(lambda out_pos, data: None)
+    return buf
+
+
+def test_compression_format(tmp_path):
+    assert compression_format(write(tmp_path, 'a.gz', gzip.compress(b'x'))) == 'gzip'
+    assert compression_format(write(tmp_path, 'a.bz2', bz2.compress(b'x'))) == 'bz2'
+    assert compression_format(write(tmp_path, 'a.xz', lzma.compress(b'x'))) == 'xz'
+    assert compression_format(write(tmp_path, 'a.log', b'plain text')) is None
+
+
+def test_build_records_length_and_restart_points(buffer):
+    assert buffer.complete
+    assert len(buffer) == len(DATA)
+    assert buffer.progress == 1.0
+    assert buffer.checkpoint_offsets == sorted(buffer.checkpoint_offsets)
+    if buffer.name == 'gzip' or buffer.path.endswith('multistream'):
+        assert len(buffer.checkpoints) > 1
+
+
+def test_random_access(buffer):
+    rng = random.Random(7)
+    for _ in range(100):
+        start = rng.randrange(len(DATA))
+        end = min(len(DATA), start + rng.randrange(1, 100000))
+        assert buffer[start:end] == DATA[start:end]
+    assert buffer[0] == DATA[0]
+    assert buffer[len(DATA) - 1] == DATA[-1]
+    assert buffer[len(DATA) - 10:] == DATA[-10:]
+    with pytest.raises(IndexError):
+        buffer[len(DATA)]
+
+
+def test_sequential_reads_resume_the_stream(buffer):
+    # Thousands of back-to-back reads, as a scan does; each carries on from the last
+    step = 97
+    assert b''.join(buffer[pos:pos + step] for pos in range(0, len(DATA), step)) == DATA
+
+
+def test_find_and_rfind(buffer):
+    for sub, start in [(b'needle', 0), (b'needle', 500000), (b'019999', 0), (b'missing', 0)]:
+        assert buffer.find(sub, start) == DATA.find(sub, start)
+    for sub, end in [(b'needle', len(DATA)), (b'needle', 500000), (b'000000', 100), (b'missing', len(DATA))]:
+        assert buffer.rfind(sub, 0, end) == DATA.rfind(sub, 0, end)
+    assert buffer.rfind(b'\n', 1000, 1000) == -1
+
+
+def test_search_before_inflation_reaches_the_end(tmp_path):
+    path = write(tmp_path, 'data.log.gz', gzip.compress(DATA))
+    buf = CompressedBuffer(path, 'gzip')
+    # Nothing inflated yet: the scan has to find the end of the data itself
+    assert len(buf) == 0 and not buf.complete
+    matches = find_all(buf, re.compile(rb'needle'), chunk_size=64 * 1024)
+    assert matches.complete
+    assert list(matches.starts) == [match.start() for match in re.finditer(rb'needle', DATA)]
+    assert matches.scanned_to == len(DATA)
+
+
+def test_document_over_a_partly_indexed_file(open_document):
+    doc = open_document(gzip.compress(DATA), name='data.log.gz')
+    assert doc.compression == 'gzip'
+    last = DATA.rfind(b'needle')
+    # No index yet, so line bounds come from searching the buffer itself
+    start, end = doc.line_bounds(last)
+    assert DATA[start:end] == DATA[DATA.rfind(b'\n', 0, last) + 1:DATA.find(b'\n', last)]
+    doc.build_index()
+    assert doc.line_count == DATA.count(b'\n')
+    assert doc.get_lines(100, 101) == DATA.split(b'\n')[100].decode()
@@ -0,0 +1,72 @@
+import codecs
+
+import pytest
+
+import line_index
+from decoding import TextCodec, sniff_encoding
+from line_index import LineIndex, LineIndexBuilder, scan_newlines
+
+TEXT = 'first\nsecond line\n\nünïcode ☃ line\nlast without newline'
+
+
+@pytest.fixture(params=['numpy', 'python'])
+def scanner(request, monkeypatch):
+    if request.param == 'python':
+        monkeypatch.setattr(line_index, 'np', None)
+    elif line_index.np is None:
+        pytest.skip("numpy is not installed")
+
+
+def expected_starts(text, encoding, bom_length):
+    starts = [bom_length]
+    for i, char in enumerate(text):
+        if char == '\n':
+            starts.append(bom_length + len(text[:i + 1].encode(encoding)))
+    return starts
+
+
+@pytest.mark.parametrize('encoding', ['utf-16-le', 'utf-16-be'])
+def test_scan_newlines_in_utf16(scanner, encoding):
+    data = TEXT.encode(encoding)
+    newline = '\n'.encode(encoding)
+    assert list(scan_newlines(data, 0, len(data), newline)) == expected_starts(TEXT, encoding, 0)[1:]
+
+
+def test_scan_newlines_ignores_utf16_newline_bytes_inside_characters(scanner):
+    # U+0A0A is 0A 0A, and U+0A00 then 'a' hold 0A 00 at an odd offset; neither is a newline
+    data = 'ਊ਀a\n'.encode('utf-16-le')
+    assert list(scan_newlines(data, 0, len(data), b'\n\x00')) == [len(data)]
+
+
+@pytest.mark.parametrize('bom, encoding', [(codecs.BOM_UTF16_LE, 'utf-16-le'), (codecs.BOM_UTF16_BE, 'utf-16-be'),
+                                           (codecs.BOM_UTF8, 'utf-8')])
+def test_line_index_after_a_byte_order_mark(scanner, bom, encoding):
+    data = bom + TEXT.encode(encoding)
+    assert sniff_encoding(data) == (encoding, len(bom))
+    codec = TextCodec.detect(data)
+    index = LineIndex(len(data), codec.bom_length)
+    # Small chunks, so lines and UTF-16 units are split across them
+    LineIndexBuilder(data, index, chunk_size=6, newline=codec.newline).run()
+
+    assert index.complete
+    assert list(index.starts) == expected_starts(TEXT, encoding, len(bom))
+    lines = TEXT.split('\n')
+    assert index.line_count == len(lines)
+    for number, line in enumerate(lines):
+        text = codec.decode(data, index.line_start(number), index.line_end(number))
+        assert text.rstrip('\n') == line
+    assert index.line_of_offset(len(bom)) == 0
+    assert index.line_of_offset(len(data) - 1) == len(lines) - 1
+
+
+def test_document_reads_utf16_lines_with_bom(open_document):
+    lines = [f"line {i} ☃ ünïcode" for i in range(500)]
+    doc = open_document(codecs.BOM_UTF16_LE + '\n'.join(lines).encode('utf-16-le') + b'\n\x00')
+    doc.build_index()
+    assert doc.encoding == 'utf-16-le'
+    assert doc.line_count == len(lines)
+    assert doc.get_lines(0, 3) == '\n'.join(lines[:3])
+    assert doc.get_lines(499, 500) == lines[499]
+    # The end of the file is a valid position too
+    assert doc.codec.char_start(doc.mm, doc.size) == doc.size
+    assert doc.column_of_offset(doc.size)[0] == len(lines) - 1
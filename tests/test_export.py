@@ -0,0 +1,89 @@
+import codecs
+import gzip
+import os
+
+import pytest
+
+import export
+from export import Export, line_span, matching_line_spans
+
+LINES = [b'%04d %s' % (i, b'ERROR disk full' if i % 10 in (3, 4) else b'INFO ok') for i in range(1000)]
+DATA = b'\n'.join(LINES) + b'\n'
+
+
+@pytest.fixture(params=['buffered', 'kernel copy'])
+def copy_mode(request, monkeypatch):
+    # Small buffers, and in one mode every span long enough to go file to file through the kernel
+    monkeypatch.setattr(export, 'WRITE_BUFFER_SIZE', 1000)
+    monkeypatch.setattr(export, 'KERNEL_COPY_STEP', 4096)
+    monkeypatch.setattr(export, 'KERNEL_COPY_MIN', 0 if request.param == 'kernel copy' else 1 << 30)
+
+
+def run(doc, spans, path, extent=None):
+    job = Export(doc, spans, str(path), extent)
+    job.run()
+    assert job.error is None
+    if extent is not None:
+        assert job.progress == 1.0
+    return path.read_bytes()
+
+
+def test_byte_and_line_spans(copy_mode, open_document, tmp_path):
+    doc = open_document(DATA)
+    doc.build_index()
+    assert run(doc, [(100, 20000)], tmp_path / 'bytes.out', (100, 20000)) == DATA[100:20000]
+    assert line_span(doc, 10, 20) == (doc.line_start(10), doc.line_start(20))
+    out = run(doc, [line_span(doc, 10, 20)], tmp_path / 'lines.out', line_span(doc, 10, 20))
+    assert out == b''.join(line + b'\n' for line in LINES[10:20])
+    assert run(doc, [line_span(doc, 0, 1000)], tmp_path / 'all.out') == DATA
+
+
+def test_matching_lines(copy_mode, open_document, tmp_path):
+    doc = open_document(DATA)
+    doc.build_index()
+    spans = list(matching_line_spans(doc, doc.search('ERROR')))
+    # Lines 3 and 4 of every ten are neighbours, so each pair is one span
+    assert len(spans) == 100
+    assert all(DATA[start:end].count(b'\n') == 2 for start, end in spans)
+    expected = b''.join(line + b'\n' for line in LINES if b'ERROR' in line)
+    assert run(doc, spans, tmp_path / 'errors.out') == expected
+
+
+def test_matching_lines_without_a_final_newline(open_document):
+    doc = open_document(b'one ERROR\ntwo\nthree ERROR')
+    doc.build_index()
+    assert list(matching_line_spans(doc, doc.search('ERROR'))) == [(0, 10), (14, 25)]
+
+
+def test_matching_lines_of_a_compressed_file(open_document, tmp_path):
+    doc = open_document(gzip.compress(DATA), name='data.log.gz')
+    doc.build_index()
+    expected = b''.join(line + b'\n' for line in LINES if b'ERROR' in line)
+    assert run(doc, matching_line_spans(doc, doc.search('ERROR')), tmp_path / 'errors.out') == expected
+
+
+def test_utf16_exports_start_with_the_byte_order_mark(open_document, tmp_path):
+    text = '\n'.join(f"{i} ☃" for i in range(100)) + '\n'
+    doc = open_document(codecs.BOM_UTF16_LE + text.encode('utf-16-le'))
+    doc.build_index()
+    out = run(doc, [line_span(doc, 5, 7)], tmp_path / 'u16.out')
+    assert out.decode('utf-16') == '5 ☃\n6 ☃\n'
+    # A span starting in the byte order mark does not write it twice
+    assert run(doc, [(0, doc.line_start(1))], tmp_path / 'first.out').decode('utf-16') == '0 ☃\n'
+
+
+def test_refuses_to_overwrite_the_source(open_document):
+    doc = open_document(DATA)
+    job = Export(doc, [(0, len(DATA))], doc.path)
+    job.run()
+    assert isinstance(job.error, OSError)
+    assert open(doc.path, 'rb').read() == DATA
+
+
+def test_cancelled_export_leaves_no_file(open_document, tmp_path):
+    doc = open_document(DATA)
+    path = tmp_path / 'cancelled.out'
+    job = Export(doc, [(0, len(DATA))], str(path))
+    job.cancelled.set()
+    job.run()
+    assert not os.path.exists(path)
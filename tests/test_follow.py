@@ -0,0 +1,73 @@
+import re
+
+import pytest
+
+from mapped_file import GROWN, TRUNCATED, UNCHANGED
+
+
+def spans(matches):
+    return list(zip(matches.starts, matches.ends))
+
+
+def continued(doc, pattern, matches):
+    worker = doc.search_in_background(pattern, matches)
+    worker.join()
+    assert matches.complete
+    return spans(matches)
+
+
+@pytest.fixture
+def grow(open_document, tmp_path):
+    def grow(before, after, name='grow.log'):
+        doc = open_document(before, name=name)
+        doc.build_index()
+        path = tmp_path / name
+
+        def append():
+            with open(path, 'ab') as f:
+                f.write(after)
+            assert doc.refresh() == GROWN
+        return doc, append
+    return grow
+
+
+def test_appended_lines_are_indexed(grow):
+    doc, append = grow(b'one\ntwo', b' more\nthree\n')
+    append()
+    assert doc.line_count == 3
+    assert doc.get_lines(0, 3) == 'one\ntwo more\nthree'
+    assert doc.refresh() == UNCHANGED
+
+
+@pytest.mark.parametrize('pattern', ['ERROR', 'ERR$', 'o ERR'])
+def test_search_continues_over_an_extended_last_line(grow, pattern):
+    doc, append = grow(b'hello\nfoo ERR', b'OR bar\nERROR\n')
+    matches = doc.search(pattern)
+    append()
+    expected = [match.span() for match in re.finditer(pattern.encode(), bytes(doc.mm), re.MULTILINE)]
+    assert continued(doc, pattern, matches) == expected
+    assert matches.scanned_to == doc.size
+
+
+def test_search_continues_after_a_newline_at_the_old_end(grow):
+    doc, append = grow(b'ERROR\nfoo\n', b'ERROR\n')
+    matches = doc.search('ERROR')
+    append()
+    assert continued(doc, 'ERROR', matches) == [(0, 5), (10, 15)]
+
+
+def test_a_search_of_the_old_mapping_shows_it_fell_short(grow):
+    # The view carries on any finished search whose scan stopped short of the file's end
+    doc, append = grow(b'ERROR one\n', b'ERROR two\n')
+    matches = doc.search('ERROR')
+    assert matches.scanned_to == doc.size
+    append()
+    assert matches.scanned_to < doc.size
+    assert continued(doc, 'ERROR', matches) == [(0, 5), (10, 15)]
+
+
+def test_truncation_is_reported(open_document, tmp_path):
+    doc = open_document(b'one\ntwo\n', name='cut.log')
+    doc.build_index()
+    (tmp_path / 'cut.log').write_bytes(b'one\n')
+    assert doc.refresh() == TRUNCATED
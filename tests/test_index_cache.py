@@ -0,0 +1,82 @@
+import os
+
+import pytest
+
+import index_cache
+from index_cache import IndexCache, evict
+from line_index import LineIndex, LineIndexBuilder
+
+DATA = b''.join(b'line %d\n' % i for i in range(5000))
+
+
+@pytest.fixture(autouse=True)
+def cache_small_files(monkeypatch):
+    monkeypatch.setattr(index_cache, 'MIN_CACHED_FILE_SIZE', 0)
+
+
+def build(data):
+    index = LineIndex(len(data))
+    LineIndexBuilder(data, index).run()
+    return index
+
+
+def test_round_trip(tmp_path):
+    path = tmp_path / 'a.log'
+    path.write_bytes(DATA)
+    stat = os.stat(path)
+    cache = IndexCache(str(tmp_path / 'cache'))
+    index = build(DATA)
+    cache.save(str(path), stat, 'utf-8', index)
+
+    loaded = cache.load(str(path), stat, 'utf-8')
+    assert loaded is not None and loaded.complete
+    assert list(loaded.starts) == list(index.starts)
+    assert loaded.line_count == index.line_count
+    assert loaded.longest == index.longest
+    loaded.close()
+
+
+def test_stale_entries_are_not_loaded(tmp_path):
+    path = tmp_path / 'a.log'
+    path.write_bytes(DATA)
+    cache = IndexCache(str(tmp_path / 'cache'))
+    cache.save(str(path), os.stat(path), 'utf-8', build(DATA))
+
+    # Another encoding is another index
+    assert cache.load(str(path), os.stat(path), 'utf-16-le') is None
+    # Rewritten with the same size but a new modification time
+    path.write_bytes(DATA.replace(b'line', b'LINE'))
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert cache.load(str(path), os.stat(path), 'utf-8') is None
+
+
+def test_corrupt_entries_are_not_loaded(tmp_path):
+    path = tmp_path / 'a.log'
+    path.write_bytes(DATA)
+    stat = os.stat(path)
+    cache = IndexCache(str(tmp_path / 'cache'))
+    cache.save(str(path), stat, 'utf-8', build(DATA))
+    entry = cache.entry_path(str(path), stat, 'utf-8')
+    with open(entry, 'r+b') as f:
+        f.truncate(os.path.getsize(entry) - 8)
+    assert cache.load(str(path), stat, 'utf-8') is None
+
+
+def test_incomplete_indexes_are_not_saved(tmp_path):
+    path = tmp_path / 'a.log'
+    path.write_bytes(DATA)
+    stat = os.stat(path)
+    cache = IndexCache(str(tmp_path / 'cache'))
+    cache.save(str(path), stat, 'utf-8', LineIndex(len(DATA)))
+    assert cache.load(str(path), stat, 'utf-8') is None
+
+
+def test_evict_removes_least_recently_used_first(tmp_path):
+    for age, name in enumerate(['new.idx', 'middle.idx', 'old.idx']):
+        entry = tmp_path / name
+        entry.write_bytes(b'x' * 100)
+        os.utime(entry, (1000000 - age * 1000, 1000000 - age * 1000))
+    (tmp_path / 'other.tri').write_bytes(b'x' * 1000)
+    evict(str(tmp_path), 250, '.idx')
+    assert sorted(os.listdir(tmp_path)) == ['middle.idx', 'new.idx', 'other.tri']
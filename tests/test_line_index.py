@@ -0,0 +1,51 @@
+import pytest
+
+import line_index
+from line_index import LineIndex, LineIndexBuilder, scan_newlines
+
+TEXT = 'first\nsecond line\n\nünïcode ☃ line\nlast without newline'
+
+
+@pytest.fixture(params=['numpy', 'python'])
+def scanner(request, monkeypatch):
+    if request.param == 'python':
+        monkeypatch.setattr(line_index, 'np', None)
+    elif line_index.np is None:
+        pytest.skip("numpy is not installed")
+
+
+def test_scan_newlines(scanner):
+    data = TEXT.encode()
+    assert list(scan_newlines(data, 0, len(data))) == [i + 1 for i, byte in enumerate(data) if byte == 10]
+
+
+def test_scan_newlines_base_and_range(scanner):
+    data = b'ab\ncd\nef\n'
+    assert list(scan_newlines(data, 3, 9, b'\n', base=100)) == [106, 109]
+
+
+def test_builder_indexes_every_line(scanner):
+    data = TEXT.encode()
+    index = LineIndex(len(data))
+    # Small chunks, so lines are split across them
+    LineIndexBuilder(data, index, chunk_size=6).run()
+
+    assert index.complete
+    lines = TEXT.split('\n')
+    assert index.line_count == len(lines)
+    for number, line in enumerate(lines):
+        assert data[index.line_start(number):index.line_end(number)].decode().rstrip('\n') == line
+    assert index.line_of_offset(len(data) - 1) == len(lines) - 1
+
+
+def test_partial_index_serves_finished_lines():
+    data = b'one\ntwo\nthree\n'
+    index = LineIndex(len(data))
+    index.add_offsets(scan_newlines(data, 0, 6), 6)
+    assert not index.complete
+    assert index.line_count == 1
+    assert index.covers(3) and not index.covers(4)
+    index.add_offsets(scan_newlines(data, 6, len(data)), len(data))
+    index.finish()
+    assert index.line_count == 3
+    assert index.line_end(2) == len(data)
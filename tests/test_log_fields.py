@@ -0,0 +1,100 @@
+import pytest
+
+import log_fields
+from log_fields import FieldExtractor, FieldTable, parse_query
+
+LEVELS = ['DEBUG', 'INFO', 'WARN', 'ERROR']
+COMPONENTS = ['api', 'cache', 'db', 'scheduler']
+
+
+def make_lines(count=600):
+    lines = []
+    for i in range(count):
+        if i % 50 == 49:
+            # A stack trace continuation, which has no fields
+            lines.append(b'    at Worker.run(Worker.java:42)')
+            continue
+        lines.append(b'2024-05-%02d %02d:%02d:%02d %-5s %s request %d done' % (
+            1 + i * 11 % 28, i % 24, i * 13 % 60, i % 60, LEVELS[i * 3 % 4].encode(),
+            COMPONENTS[i % 5 % 4].encode(), i))
+    return lines
+
+
+def fields_of(line):
+    parts = line.decode().split()
+    if not parts[0][0].isdigit():
+        return None
+    return {'time': f"{parts[0]} {parts[1]}", 'level': parts[2], 'component': parts[3]}
+
+
+def reference(lines, terms):
+    selected = []
+    for number, line in enumerate(lines):
+        fields = fields_of(line)
+        if fields is None:
+            continue
+        if all(log_fields.value_test(op, target)(fields[name]) for name, op, target in terms):
+            selected.append(number)
+    return selected
+
+
+@pytest.fixture(params=['numpy', 'python'])
+def vectorised(request, monkeypatch):
+    if request.param == 'python':
+        monkeypatch.setattr(log_fields, 'np', None)
+    elif log_fields.np is None:
+        pytest.skip("numpy is not installed")
+
+
+QUERIES = [
+    'level=ERROR',
+    'level=ERROR,WARN',
+    'level!=INFO',
+    'component~che',
+    'component~sch,db',
+    'time<2024-05-10',
+    'time<=2024-05-07 03:39:03',
+    'time>2024-05-20 12:00',
+    'time>=2024-05-28',
+    'level=ERROR AND time>=2024-05-14 and component!=db',
+    'level=NOPE',
+    'time<0',
+    'time>9',
+    '',
+]
+
+
+@pytest.mark.parametrize('query', QUERIES)
+def test_filter_matches_a_line_by_line_reference(vectorised, open_document, query):
+    lines = make_lines()
+    doc = open_document(b'\n'.join(lines) + b'\n')
+    doc.build_index()
+    table = FieldTable()
+    FieldExtractor(doc, table).run()
+    assert table.parsed == len(lines)
+
+    expected = reference(lines, parse_query(query, table.fields)) if query else list(range(len(lines)))
+    assert list(table.filter(query)) == expected
+
+
+def test_range_filters_see_values_parsed_after_an_earlier_filter(vectorised, open_document):
+    lines = make_lines()
+    doc = open_document(b'\n'.join(lines) + b'\n')
+    doc.build_index()
+    table = FieldTable()
+    table.extend(doc, 200)
+    query = 'time>=2024-05-15'
+    assert list(table.filter(query)) == reference(lines[:200], parse_query(query, table.fields))
+    table.extend(doc, len(lines))
+    assert list(table.filter(query)) == reference(lines, parse_query(query, table.fields))
+
+
+def test_fields_and_query_errors():
+    table = FieldTable()
+    assert table.fields == ['time', 'level', 'component']
+    assert parse_query('level = ERROR AND time>"2024-05-01"', table.fields) == [('level', '=', 'ERROR'),
+                                                                                ('time', '>', '2024-05-01')]
+    with pytest.raises(ValueError):
+        parse_query('message=oops', table.fields)
+    with pytest.raises(ValueError):
+        parse_query('level ERROR', table.fields)
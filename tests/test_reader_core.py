@@ -0,0 +1,96 @@
+import pytest
+
+import reader_core
+from reader_core import PENDING, parse_range
+from search_engine import MatchList
+
+LINES = [f"{i:05d} {'ERROR' if i % 100 == 0 else 'INFO'} message {i}" for i in range(1000)]
+DATA = ('\n'.join(LINES) + '\n').encode()
+
+
+@pytest.fixture
+def doc(open_document):
+    doc = open_document(DATA)
+    doc.build_index()
+    return doc
+
+
+def test_resolve_position(doc):
+    assert doc.resolve_position('1') == 0
+    assert doc.resolve_position(' 1,000 ') == doc.line_start(999)
+    assert doc.resolve_position('1_0') == doc.line_start(9)
+    assert doc.resolve_position('@0') == 0
+    assert doc.resolve_position('@100') == 100
+    assert doc.resolve_position('@0x100') == 256
+    assert doc.resolve_position('0%') == 0
+    assert doc.resolve_position('50%') == doc.size // 2
+    assert doc.resolve_position('12.5%') == doc.size // 8
+    # The very end names the last byte
+    assert doc.resolve_position('100%') == doc.size - 1
+    assert doc.resolve_position(f'@{doc.size}') == doc.size - 1
+
+
+@pytest.mark.parametrize('position', ['0', '1001', '-3', '@-1', '@999999', '101%', 'abc', '@zz', '', '%'])
+def test_resolve_position_rejects(doc, position):
+    with pytest.raises(ValueError):
+        doc.resolve_position(position)
+
+
+def test_resolve_position_moves_off_continuation_bytes(open_document):
+    doc = open_document('aé\nß\n'.encode())
+    doc.build_index()
+    # Byte 2 is the second byte of é
+    assert doc.resolve_position('@2') == 1
+
+
+def test_resolve_position_past_a_partial_index(open_document):
+    doc = open_document(DATA)
+    with pytest.raises(ValueError, match='indexed so far'):
+        doc.resolve_position('10')
+    with pytest.raises(ValueError, match='indexed so far'):
+        doc.resolve_position('@500')
+
+
+def test_grep_and_lines(doc):
+    assert list(doc.grep('ERROR')) == [(i, LINES[i]) for i in range(0, 1000, 100)]
+    assert list(doc.grep('error', ignore_case=True, whole_word=True))[1] == (100, LINES[100])
+    assert list(doc.iter_lines(998)) == LINES[998:]
+    assert doc.line_bounds(doc.line_start(5) + 3) == (doc.line_start(5), doc.line_end(5) - 1)
+
+
+def test_next_and_previous_match(doc):
+    matches = doc.search('ERROR')
+    first, second = matches.span(0), matches.span(1)
+    assert doc.next_match(matches) == first
+    assert doc.next_match(matches, first[0]) == second
+    assert doc.previous_match(matches, second[0]) == first
+    assert doc.previous_match(matches) == matches.span(len(matches) - 1)
+    assert doc.next_match(matches, doc.size) is None
+
+    partial = MatchList()
+    partial.add(matches.starts[:1], matches.ends[:1], second[0])
+    assert doc.next_match(partial, first[0]) is PENDING
+    assert doc.previous_match(partial, second[0] + 1) is PENDING
+    assert doc.previous_match(partial, second[0]) == first
+
+
+def test_parse_range():
+    assert parse_range('5') == (5, 5)
+    assert parse_range('5-10') == (5, 10)
+
+
+def test_cli(open_document, tmp_path, capsys):
+    path = open_document(DATA).path
+    assert reader_core.main(['grep', '-c', 'ERROR', path]) == 0
+    assert capsys.readouterr().out == '10\n'
+    assert reader_core.main(['grep', '-n', '-m', '2', '-w', '-i', 'error', path]) == 0
+    assert capsys.readouterr().out == f"1:{LINES[0]}\n101:{LINES[100]}\n"
+    assert reader_core.main(['grep', 'NOTHERE', path]) == 1
+    assert reader_core.main(['grep', '(', path]) == 2
+    capsys.readouterr()
+
+    assert reader_core.main(['lines', path, '3', '4']) == 0
+    assert capsys.readouterr().out == f"{LINES[2]}\n{LINES[3]}\n"
+    output = tmp_path / 'errors.log'
+    assert reader_core.main(['export', '--matching', 'ERROR', path, str(output)]) == 0
+    assert output.read_text() == ''.join(line + '\n' for line in LINES if 'ERROR' in line)
@@ -0,0 +1,124 @@
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import search_engine
+from search_engine import collect, compile_pattern, find_all, hit_histogram, scan_chunks, scan_shards
+
+
+def spans(matches):
+    return list(zip(matches.starts, matches.ends))
+
+
+def regex_spans(pattern, data, flags=0):
+    return [match.span() for match in re.finditer(pattern, data, flags)]
+
+
+LINES = b''.join(b'line %d %s\n' % (i, b'needle' if i % 7 == 0 else b'hay') for i in range(2000))
+
+
+@pytest.mark.parametrize('chunk_size', [1, 13, 64, 1000, 1 << 20])
+def test_scan_chunks_finds_every_match_once(chunk_size):
+    regex = re.compile(rb'needle')
+    assert spans(find_all(LINES, regex, chunk_size=chunk_size)) == regex_spans(rb'needle', LINES)
+
+
+@pytest.mark.parametrize('chunk_size', [1, 20, 64])
+def test_scan_chunks_keeps_matches_that_cross_chunk_boundaries(chunk_size):
+    # Every match runs over two lines, so most of them cross a line-aligned chunk boundary
+    pattern = rb'needle\nline \d+'
+    matches = find_all(LINES, re.compile(pattern), chunk_size=chunk_size)
+    assert spans(matches) == regex_spans(pattern, LINES)
+    assert matches.complete
+    assert matches.scanned_to >= len(LINES)
+
+
+def test_scan_chunks_anchors_see_real_line_ends():
+    pattern = rb'^line \d+0 hay$'
+    regex = re.compile(pattern, re.MULTILINE)
+    assert spans(find_all(LINES, regex, chunk_size=50)) == regex_spans(pattern, LINES, re.MULTILINE)
+
+
+def test_scan_chunks_range_and_resume():
+    regex = re.compile(rb'needle')
+    everything = regex_spans(rb'needle', LINES)
+    middle = len(LINES) // 2
+    first = collect(scan_chunks(LINES, regex, 0, middle, chunk_size=100))
+    rest = collect(scan_chunks(LINES, regex, first.scanned_to, None, chunk_size=100))
+    assert spans(first) + spans(rest) == everything
+    assert all(start < middle for start, _ in spans(first))
+
+
+def test_scan_chunks_drops_matches_inside_utf16_units():
+    # U+6100 is 00 61 in UTF-16-LE, so 'a' (61 00) appears at an odd offset across two characters
+    data = '愀\u0000a'.encode('utf-16-le')
+    regex = compile_pattern('a', 'utf-16-le')
+    assert spans(find_all(data, regex, unit=2)) == [(4, 6)]
+    assert len(find_all(data, regex, unit=1)) == 2
+
+
+@pytest.mark.parametrize('encoding, unit', [('ascii', 1), ('utf-16-le', 2), ('utf-16-be', 2)])
+def test_scan_chunks_cuts_lines_far_longer_than_a_chunk(monkeypatch, encoding, unit):
+    # One line with no newline for many chunks; each step must still cover a bounded stretch
+    monkeypatch.setattr(search_engine, 'CHUNK_OVERLAP', 64)
+    data = ''.join(f'"n": {i}, ' for i in range(5000)).encode(encoding) + '\n'.encode(encoding)
+    regex = compile_pattern('"n": ', encoding)
+    steps = list(scan_chunks(data, regex, chunk_size=500, unit=unit))
+    assert len(steps) > 50
+    pos = 0
+    for resume, starts, ends in steps:
+        assert resume - pos <= 500 + 2 * 64 + 20
+        assert resume % unit == 0 or resume == len(data)
+        pos = resume
+    assert spans(collect(steps)) == regex_spans(re.escape('"n": '.encode(encoding)), data)
+
+
+def test_scan_chunks_stops_when_cancelled():
+    class Cancelled:
+        def is_set(self):
+            return True
+
+    assert list(scan_chunks(LINES, re.compile(rb'needle'), chunk_size=100, cancelled=Cancelled())) == []
+
+
+@pytest.mark.parametrize('workers', [1, 3, 8])
+def test_scan_shards_matches_a_single_scan(tmp_path, workers):
+    path = tmp_path / 'sharded.log'
+    path.write_bytes(LINES)
+    pattern = rb'needle\nline \d+'
+    with ThreadPoolExecutor(workers) as executor:
+        matches = collect(scan_shards(str(path), LINES, re.compile(pattern), executor=executor, workers=workers))
+    assert spans(matches) == regex_spans(pattern, LINES)
+    assert matches.scanned_to >= len(LINES)
+
+
+def test_scan_shards_drops_a_match_that_ran_on_from_the_previous_shard(tmp_path):
+    # A match spanning all of the file starts in the first shard only, and must be kept once
+    data = b'a\n' * 50 + b'b\n'
+    path = tmp_path / 'run.log'
+    path.write_bytes(data)
+    pattern = rb'(?:a\n)+b'
+    with ThreadPoolExecutor(4) as executor:
+        matches = collect(scan_shards(str(path), data, re.compile(pattern), executor=executor, workers=4))
+    assert spans(matches) == [(0, len(data) - 1)]
+
+
+def test_match_list_navigation():
+    matches = find_all(LINES, re.compile(rb'needle'))
+    starts = list(matches.starts)
+    assert matches.next_after(-1) == matches.span(0)
+    assert matches.next_after(starts[0]) == matches.span(1)
+    assert matches.next_after(starts[-1]) is None
+    assert matches.previous_before(starts[1]) == matches.span(0)
+    assert matches.previous_before(starts[0]) is None
+    assert list(matches.between(starts[2], starts[5])) == [matches.span(i) for i in range(2, 5)]
+    assert matches.rank(starts[3]) == 4
+
+
+def test_hit_histogram_counts_every_start():
+    matches = find_all(LINES, re.compile(rb'needle'))
+    counts = hit_histogram(matches.starts, len(LINES), 10)
+    assert len(counts) == 10
+    assert sum(counts) == len(matches)
+    assert hit_histogram(matches.starts, 0, 10) == []
@@ -0,0 +1,58 @@
+import re
+
+import pytest
+
+from search_engine import DENSE_HITS, LiteralPattern, compile_pattern, find_all
+
+
+def spans(matches):
+    return list(zip(matches.starts, matches.ends))
+
+
+def regex_spans(pattern, data, flags=0):
+    return [match.span() for match in re.finditer(pattern, data, flags)]
+
+
+@pytest.mark.parametrize('gap', [1, 10, 5000])
+def test_literal_pattern_matches_the_regex_engine_at_any_density(gap):
+    # Dense hits move from find to the regex engine part way; the matches must not change
+    data = (b'x' * gap + b'hit') * (DENSE_HITS * 3) + b'tail hit'
+    assert spans(find_all(data, LiteralPattern(b'hit'))) == regex_spans(rb'hit', data)
+
+
+def test_literal_pattern_options():
+    data = b'Cache cached CACHE cache_ cache.'
+    assert spans(find_all(data, LiteralPattern(b'CACHE', ignore_case=True))) == regex_spans(rb'cache', data, re.I)
+    assert spans(find_all(data, LiteralPattern(b'cache', whole_word=True))) == [(26, 31)]
+    matches = find_all(data, LiteralPattern(b'cache', ignore_case=True, whole_word=True))
+    assert [data[start:end] for start, end in spans(matches)] == [b'Cache', b'CACHE', b'cache']
+
+
+@pytest.mark.parametrize('encoding', ['utf-16-le', 'utf-16-be'])
+def test_utf16_case_folding_only_folds_ascii_units(encoding):
+    # Ł is 41 01 in UTF-16-LE and š is 61 01; lowercasing bytes would make them equal
+    data = 'Ł š ABC abc'.encode(encoding)
+
+    def found(query):
+        matches = find_all(data, compile_pattern(query, encoding, literal=True, ignore_case=True), unit=2)
+        return [data[start:end].decode(encoding) for start, end in spans(matches)]
+
+    assert found('Ł') == ['Ł']
+    assert found('š') == ['š']
+    assert found('abc') == ['ABC', 'abc']
+
+
+def test_compile_pattern():
+    assert compile_pattern('a.c').search(b'abc')
+    assert len(find_all(b'a.c abc', compile_pattern('a.c', literal=True))) == 1
+    assert len(find_all(b'xab ab', compile_pattern('ab', whole_word=True))) == 1
+    assert len(find_all(b'x.ab .ab', compile_pattern(r'\.ab', whole_word=True))) == 1
+    with pytest.raises(re.error):
+        compile_pattern('café', 'ascii')
+
+
+def test_compile_pattern_rejects_regex_syntax_in_utf16():
+    with pytest.raises(re.error):
+        compile_pattern('a.c', 'utf-16-le')
+    data = 'a.c abc'.encode('utf-16-le')
+    assert len(find_all(data, compile_pattern('a.c', 'utf-16-le', literal=True), unit=2)) == 1
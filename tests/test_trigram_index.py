@@ -0,0 +1,128 @@
+import mmap
+import os
+import re
+
+import pytest
+
+pytest.importorskip('numpy')
+
+from search_engine import compile_pattern, find_all  # noqa: E402
+from trigram_index import BLOCK_SIZE, TrigramIndex, required_trigrams  # noqa: E402
+
+LINE = b'2024-05-02 08:32:31 INFO  cache request completed\n'
+BLOCKS = 8
+
+
+def make_log(needle_block=None, blocks=BLOCKS, line=LINE):
+    data = bytearray(line * (blocks * BLOCK_SIZE // len(line)))
+    if needle_block is not None:
+        at = needle_block * BLOCK_SIZE + 1000
+        data[at:at + 12] = b'UNIQUENEEDLE'
+    return bytes(data)
+
+
+class Indexed:
+    def __init__(self, tmp_path, data):
+        self.path = str(tmp_path / 'big.log')
+        self.directory = str(tmp_path / 'trigrams')
+        with open(self.path, 'wb') as f:
+            f.write(data)
+
+    def open(self):
+        return TrigramIndex(self.path, os.stat(self.path), directory=self.directory)
+
+    def update(self, index):
+        with open(self.path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            assert index.update(mm, os.stat(self.path))
+
+    def search(self, index, pattern):
+        regex = compile_pattern(pattern)
+        with open(self.path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            found = list(index.scan(mm, regex, required_trigrams(regex), 64 * 1024))
+            starts = [start for _, starts, _ in found for start in starts]
+            assert starts == list(find_all(mm, regex).starts)
+            assert found[-1][0] >= len(mm)
+            return starts
+
+
+def test_required_trigrams():
+    assert required_trigrams(re.compile(rb'needle')) == [b'nee', b'eed', b'edl', b'dle']
+    assert required_trigrams(re.compile(rb'ab.cdef')) == [b'cde', b'def']
+    assert required_trigrams(re.compile(rb'needle', re.IGNORECASE)) == []
+    assert required_trigrams(re.compile(rb'ab|cd')) == []
+    assert required_trigrams(compile_pattern('needle', literal=True)) == [b'nee', b'eed', b'edl', b'dle']
+
+
+def test_round_trip_and_narrowed_search(tmp_path):
+    indexed = Indexed(tmp_path, make_log(needle_block=3))
+    index = indexed.open()
+    assert index.indexed == 0 and index.rows is None
+    indexed.update(index)
+
+    reopened = indexed.open()
+    assert reopened.indexed == os.path.getsize(indexed.path)
+    assert (reopened.rows == index.rows).all()
+    candidates = reopened.candidates([b'UNI', b'NEE', b'DLE']).tolist()
+    # The block holding the needle, the one before it (a match may start there) and the unindexed tail
+    assert 3 in candidates and len(candidates) <= 3
+    assert indexed.search(reopened, 'UNIQUENEEDLE') == [3 * BLOCK_SIZE + 1000]
+    assert indexed.search(reopened, 'INFO  cache')[:2] == [20, 20 + len(LINE)]
+    index.close()
+    reopened.close()
+
+
+def test_common_words_before_a_rare_one_still_narrow_the_search(tmp_path):
+    data = make_log(needle_block=3)
+    indexed = Indexed(tmp_path, data)
+    index = indexed.open()
+    indexed.update(index)
+    # Well over a handful of trigrams that are in every block come first
+    at = data.index(b'UNIQUENEEDLE')
+    trigrams = required_trigrams(compile_pattern(data[at - 40:at + 12].decode(), literal=True))
+    assert len(trigrams) > 20
+    candidates = index.candidates(trigrams).tolist()
+    assert 3 in candidates and len(candidates) <= 3
+    assert indexed.search(index, data[at - 40:at + 12].decode()) == [at - 40]
+    index.close()
+
+
+def test_appended_bytes_extend_the_index(tmp_path):
+    indexed = Indexed(tmp_path, make_log())
+    index = indexed.open()
+    indexed.update(index)
+    size = index.indexed
+    with open(indexed.path, 'ab') as f:
+        f.write(b'late UNIQUENEEDLE\n' + make_log(blocks=2))
+
+    reopened = indexed.open()
+    # Still valid for the bytes it covers; the rest is scanned in full until updated
+    assert reopened.indexed == size
+    assert indexed.search(reopened, 'UNIQUENEEDLE') == [size + 5]
+    indexed.update(reopened)
+    assert indexed.open().indexed == os.path.getsize(indexed.path)
+    assert indexed.search(reopened, 'UNIQUENEEDLE') == [size + 5]
+
+
+@pytest.mark.parametrize('rewrite', ['shorter', 'same size', 'copytruncate past the old size'])
+def test_rewritten_files_are_indexed_again(tmp_path, rewrite):
+    indexed = Indexed(tmp_path, make_log())
+    index = indexed.open()
+    indexed.update(index)
+    stat = os.stat(indexed.path)
+
+    other = LINE.replace(b'cache', b'queue')
+    if rewrite == 'shorter':
+        data = make_log(blocks=4, line=other)
+    elif rewrite == 'same size':
+        data = make_log(line=other)
+    else:
+        data = make_log(blocks=BLOCKS + 2, line=other)
+    with open(indexed.path, 'r+b') as f:
+        f.truncate(0)
+        f.write(data)
+    os.utime(indexed.path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+    stale = indexed.open()
+    assert stale.indexed == 0 and stale.rows is None
+    indexed.update(stale)
+    assert len(indexed.search(stale, 'INFO  queue')) == len(data) // len(other)
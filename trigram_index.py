@@ -0,0 +1,270 @@
+import hashlib
+import mmap
+import os
+import re
+import struct
+import threading
+from array import array
+
+from index_cache import CACHE_DIR, evict
+from search_engine import scan_chunks
+
+try:
+    from re import _parser as sre_parse
+except ImportError:
+    import sre_parse
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Building and querying are only fast enough vectorised
+AVAILABLE = np is not None
+
+# Stored beside the line-offset cache
+TRIGRAM_DIR = os.path.join(os.path.dirname(CACHE_DIR), 'trigram-index')
+DEFAULT_TRIGRAM_CACHE_BYTES = 2 * 1024 * 1024 * 1024
+# Smaller files are scanned faster than an index is consulted
+MIN_TRIGRAM_FILE_SIZE = 16 * 1024 * 1024
+
+BLOCK_SIZE = 256 * 1024
+# Trigrams hash into 2 ** BITS_LOG2 buckets; each block keeps one bit per bucket (16 KB, ~6% of the block)
+BITS_LOG2 = 17
+ROW_BYTES = (1 << BITS_LOG2) // 8
+# Blocks hashed per numpy pass while building
+BUILD_BLOCKS = 16
+
+MAGIC = b'FTRTRI02'
+# magic, block size, hash bits, bytes indexed, file mtime when last indexed, fingerprint of the indexed bytes
+HEADER = struct.Struct('8sQQQQ16s')
+
+
+def trigram_hash(codes):
+    # Multiplicative hashing; works on ints and uint32 arrays alike (arrays wrap on overflow)
+    return ((codes * 2654435761) & 0xFFFFFFFF) >> (32 - BITS_LOG2)
+
+
+def required_trigrams(regex):
+    """Return 3-byte strings every match of regex contains within BLOCK_SIZE bytes of its start.
+
+    Only literal runs at a bounded distance from the start of the pattern
+    are used, so a match starting in block i has them all in blocks i and
+    i + 1. An empty list means the index cannot narrow the query.
+    """
+    if regex.flags & re.IGNORECASE or not isinstance(regex.pattern, bytes):
+        return []
+    parsed = sre_parse.parse(regex.pattern, regex.flags)
+    literals = []
+    run = bytearray()
+    offset = 0
+    for item in parsed:
+        op, arg = item
+        if op is sre_parse.LITERAL:
+            run.append(arg)
+            offset += 1
+            continue
+        if op is sre_parse.AT:
+            # Anchors take no room in the match
+            continue
+        literals.append(bytes(run))
+        run = bytearray()
+        offset += sre_parse.SubPattern(parsed.state, [item]).getwidth()[1]
+        if offset > BLOCK_SIZE:
+            break
+    else:
+        literals.append(bytes(run))
+
+    trigrams = []
+    for literal in literals:
+        for i in range(len(literal) - 2):
+            trigram = literal[i:i + 3]
+            if trigram not in trigrams:
+                trigrams.append(trigram)
+    return trigrams
+
+
+def prefix_fingerprint(buf, indexed):
+    """Hash the first and last blocks of buf[:indexed], which tells a file appended to from one rewritten."""
+    head = buf[:min(indexed, BLOCK_SIZE)]
+    tail = buf[max(0, indexed - BLOCK_SIZE):indexed]
+    return hashlib.blake2b(head + tail, digest_size=16).digest()
+
+
+def block_rows(buf, first, last, size):
+    """Return the bucket bitsets of blocks [first, last) of buf[:size] as a (blocks, ROW_BYTES) array.
+
+    A trigram belongs to the block it starts in, so each block also reads
+    the two bytes after it.
+    """
+    start = first * BLOCK_SIZE
+    end = min(size, last * BLOCK_SIZE + 2)
+    present = np.zeros((last - first) << BITS_LOG2, dtype=bool)
+    if end - start >= 3:
+        view = np.frombuffer(buf, dtype=np.uint8, count=end - start, offset=start)
+        codes = view[:-2].astype(np.uint32) << 16
+        codes |= view[1:-1].astype(np.uint32) << 8
+        codes |= view[2:]
+        del view
+        buckets = trigram_hash(codes)
+        buckets |= (np.arange(len(codes), dtype=np.uint32) // BLOCK_SIZE) << BITS_LOG2
+        present[buckets] = True
+    return np.packbits(present.reshape(last - first, 1 << BITS_LOG2), axis=1)
+
+
+class TrigramIndex:
+    """Per-block sets of hashed byte trigrams of one file, kept on disk.
+
+    A query's required trigrams rule out every block that lacks one, so a
+    search only has to verify the rest. Entries are keyed by file identity
+    rather than size, so bytes appended to a log extend an existing index;
+    a fingerprint of the indexed bytes catches a file rewritten past the
+    size it had.
+    """
+
+    def __init__(self, path, stat, directory=TRIGRAM_DIR, max_bytes=DEFAULT_TRIGRAM_CACHE_BYTES):
+        self.path = path
+        self.directory = directory
+        self.max_bytes = max_bytes
+        key = '\0'.join([os.path.realpath(path), str(stat.st_dev), str(stat.st_ino), str(BLOCK_SIZE),
+                         str(BITS_LOG2)])
+        self.entry = os.path.join(directory, hashlib.sha1(key.encode()).hexdigest() + '.tri')
+        self.indexed = 0
+        self.rows = None
+
+        try:
+            with open(self.entry, 'rb') as f:
+                header = f.read(HEADER.size)
+                length = os.fstat(f.fileno()).st_size
+        except OSError:
+            return
+        if len(header) < HEADER.size:
+            return
+        magic, block_size, bits_log2, indexed, mtime_ns, fingerprint = HEADER.unpack(header)
+        count = -(-indexed // BLOCK_SIZE)
+        if (magic != MAGIC or (block_size, bits_log2) != (BLOCK_SIZE, BITS_LOG2)
+                or length < HEADER.size + count * ROW_BYTES or indexed > stat.st_size
+                or (indexed == stat.st_size and mtime_ns != stat.st_mtime_ns)):
+            # Another file now, or rewritten in place rather than appended to
+            return
+        try:
+            with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                current = prefix_fingerprint(mm, indexed)
+        except (OSError, ValueError):
+            return
+        if current != fingerprint:
+            # Truncated and written past the old size again, as copytruncate rotation does
+            return
+        self.indexed = indexed
+        self.map_rows(count)
+
+    def map_rows(self, count):
+        self.rows = np.memmap(self.entry, dtype=np.uint8, mode='r', offset=HEADER.size,
+                              shape=(count, ROW_BYTES)) if count else None
+
+    def update(self, buf, stat, cancelled=None):
+        """Index bytes appended since the last update (all of them the first time); False if cancelled."""
+        size = stat.st_size
+        # The last indexed block may be partial, or lack the two bytes after it
+        first = max(0, (self.indexed - 1) // BLOCK_SIZE)
+        count = -(-size // BLOCK_SIZE)
+        os.makedirs(self.directory, exist_ok=True)
+        # Appends only ever add rows, so they go in place; a new index is written aside and swapped in
+        # so nobody else's mapping of an old entry is cut short
+        target = self.entry if self.indexed else f"{self.entry}.{os.getpid()}.tmp"
+        try:
+            with open(target, 'r+b' if self.indexed else 'wb') as f:
+                f.seek(HEADER.size + first * ROW_BYTES)
+                for block in range(first, count, BUILD_BLOCKS):
+                    if cancelled is not None and cancelled.is_set():
+                        return False
+                    f.write(block_rows(buf, block, min(count, block + BUILD_BLOCKS), size).tobytes())
+                f.truncate()
+                f.seek(0)
+                f.write(HEADER.pack(MAGIC, BLOCK_SIZE, BITS_LOG2, size, stat.st_mtime_ns,
+                                    prefix_fingerprint(buf, size)))
+            if target != self.entry:
+                os.replace(target, self.entry)
+        finally:
+            if target != self.entry and os.path.exists(target):
+                os.remove(target)
+        self.indexed = size
+        self.map_rows(count)
+        evict(self.directory, self.max_bytes, '.tri')
+        return True
+
+    def candidates(self, trigrams):
+        """Return the numbers of the blocks a match holding every trigram could start in."""
+        present = np.ones(len(self.rows), dtype=bool)
+        # Every trigram is checked, since the words a query starts with are often in every block
+        for trigram in trigrams:
+            bucket = trigram_hash(int.from_bytes(trigram, 'big'))
+            # packbits stores the first bucket of each byte in its highest bit
+            column = (self.rows[:, bucket >> 3] & (0x80 >> (bucket & 7))) != 0
+            # A match starting in one block may finish its literal in the next
+            reach = column.copy()
+            reach[:-1] |= column[1:]
+            present &= reach
+            if not present[:-1].any():
+                break
+        # The last block's neighbour is not indexed yet, so it can never be ruled out
+        present[-1] = True
+        return np.flatnonzero(present)
+
+    def scan(self, buf, regex, trigrams, chunk_size, unit=1, cancelled=None):
+        """Like scan_chunks over the whole of buf, verifying only candidate blocks and bytes past the index."""
+        ranges = []
+        for block in self.candidates(trigrams).tolist():
+            lo, hi = block * BLOCK_SIZE, min(self.indexed, (block + 1) * BLOCK_SIZE)
+            if ranges and ranges[-1][1] == lo:
+                ranges[-1][1] = hi
+            else:
+                ranges.append([lo, hi])
+        # Bytes appended after the index was last updated are scanned in full
+        if ranges and ranges[-1][1] == self.indexed:
+            ranges[-1][1] = None
+        else:
+            ranges.append([self.indexed, None])
+
+        pos = 0
+        for lo, hi in ranges:
+            if hi is not None and hi <= pos:
+                continue
+            if lo > pos:
+                # Nothing between pos and lo can match; report it as scanned
+                yield lo, array('Q'), array('Q')
+                pos = lo
+            for resume, starts, ends in scan_chunks(buf, regex, pos, hi, chunk_size, unit, cancelled):
+                pos = resume
+                yield resume, starts, ends
+            if cancelled is not None and cancelled.is_set():
+                return
+
+    def close(self):
+        self.rows = None
+
+
+class TrigramIndexBuilder(threading.Thread):
+    """Bring a TrigramIndex up to date with a buffer in a worker thread."""
+
+    def __init__(self, buf, index, stat, on_finish=None):
+        super().__init__(daemon=True)
+        self.buf = buf
+        self.index = index
+        self.stat = stat
+        self.on_finish = on_finish
+        self.cancelled = threading.Event()
+
+    def run(self):
+        try:
+            finished = self.index.update(self.buf, self.stat, self.cancelled)
+        except OSError:
+            # The index is an optimisation only; searches scan everything without it
+            return
+        if finished and self.on_finish is not None:
+            self.on_finish()
+
+    def cancel(self):
+        self.cancelled.set()
+        if self.is_alive():
+            self.join()